@@ -0,0 +1,43 @@
+# background_writer.py
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class BackgroundWriter:
+    def __init__(self, name="sheet-writer"):
+        # one worker keeps writes in submission order while the caller keeps scraping
+        self.tasks = queue.Queue()
+        # the first failed write, later writes are dropped so queued progress never runs past it
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        # a failed write stops the caller at its next write, not hours later at flush
+        if self.error:
+            raise self.error
+        future = Future()
+        self.tasks.put((future, func, args, kwargs))
+        return future
+
+    def flush(self):
+        self.tasks.join()
+        if self.error:
+            raise self.error
+
+    def run(self):
+        while True:
+            future, func, args, kwargs = self.tasks.get()
+            try:
+                if self.error:
+                    future.cancel()
+                    future.set_running_or_notify_cancel()
+                elif future.set_running_or_notify_cancel():
+                    future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                print(f"Background write {getattr(func, '__name__', func)} failed: {e}")
+                self.error = e
+                future.set_exception(e)
+            finally:
+                self.tasks.task_done()
@@ -0,0 +1,89 @@
+# browser_pool.py
+import os
+import queue
+import threading
+
+from driver_manager import DriverManager
+
+# a headless Chrome with a few tabs of history settles around this much RSS
+CHROME_MEMORY_MB = 600
+
+
+def available_memory_mb():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+def default_pool_size():
+    # BROWSER_POOL_SIZE wins, otherwise one Chrome per core while memory allows
+    configured = os.environ.get("BROWSER_POOL_SIZE")
+    if configured:
+        return max(1, int(configured))
+    size = os.cpu_count() or 1
+    memory = available_memory_mb()
+    if memory:
+        size = min(size, memory // CHROME_MEMORY_MB)
+    return max(1, size)
+
+
+class BrowserPool:
+    def __init__(self, driver_factory, size=None):
+        self.driver_factory = driver_factory
+        self.size = size or default_pool_size()
+
+    def imap_unordered(self, func, items):
+        # func(driver, item) runs on one of the pool's drivers, results come back as (item, result, error)
+        work = queue.Queue(maxsize=self.size * 2)
+        results = queue.Queue()
+        stopped = []
+        workers = [threading.Thread(target=self._work, args=(func, work, results, stopped), daemon=True)
+                   for _ in range(self.size)]
+        for worker in workers:
+            worker.start()
+        print(f"Browser pool started with {self.size} drivers")
+
+        def feed():
+            for item in items:
+                work.put(item)
+            for _ in workers:
+                work.put(None)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        finished = 0
+        while finished < len(workers):
+            result = results.get()
+            if result is None:
+                finished += 1
+                continue
+            yield result
+        if stopped and (feeder.is_alive() or not work.empty()):
+            # every worker that could take items has stopped, the rest of the items were never processed
+            raise RuntimeError(f"Browser pool stopped with items left: {stopped[0]}")
+
+    def _work(self, func, work, results, stopped):
+        # each worker recycles its own browser, a crash only costs that worker a restart
+        manager = DriverManager(self.driver_factory)
+        try:
+            manager.get()
+            while True:
+                item = work.get()
+                if item is None:
+                    break
+                try:
+                    results.put((item, manager.run(func, item), None))
+                except Exception as e:
+                    results.put((item, None, e))
+        except Exception as e:
+            # the remaining workers keep draining the queue
+            print(f"Browser pool worker stopped: {e}")
+            stopped.append(e)
+        finally:
+            manager.quit()
+            results.put(None)
@@ -0,0 +1,129 @@
+# chrome_host.py
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from selenium import webdriver
+
+from page_fetcher import USER_AGENT
+
+CHROME_PORT = int(os.environ.get("CHROME_PORT", 9222))
+# profile and HTTP disk cache are kept here, so static assets are downloaded once per runner
+CHROME_PROFILE_DIR = os.environ.get("CHROME_PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "yourcareer_chrome")
+CHROME_CACHE_MB = int(os.environ.get("CHROME_CACHE_MB", 512))
+
+
+class AttachedChrome(webdriver.Chrome):
+    def quit(self):
+        # close only our tab, the shared browser keeps running for the next script
+        try:
+            self.close()
+        except Exception as e:
+            print(f"Could not close tab: {type(e).__name__}")
+        super().quit()
+
+
+def chrome_binary():
+    configured = os.environ.get("CHROME_BINARY")
+    if configured:
+        return configured
+    for name in ["google-chrome", "google-chrome-stable", "chromium", "chromium-browser"]:
+        path = shutil.which(name)
+        if path:
+            return path
+    raise FileNotFoundError("Chrome not found, set CHROME_BINARY")
+
+
+def debugger_ready(address):
+    try:
+        with urllib.request.urlopen(f"http://{address}/json/version", timeout=2) as response:
+            return json.load(response)
+    except OSError:
+        return None
+
+
+def start_chrome(port=CHROME_PORT, profile_dir=CHROME_PROFILE_DIR, timeout=30):
+    # returns the debugger address, reusing a Chrome that already listens on the port
+    address = f"127.0.0.1:{port}"
+    if debugger_ready(address):
+        return address
+    # every scraper process on the host may find the browser gone at once, only one of them starts it
+    with open(f"{profile_dir}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            return launch_chrome(address, port, profile_dir, timeout)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def launch_chrome(address, port, profile_dir, timeout):
+    if debugger_ready(address):
+        return address
+    os.makedirs(profile_dir, exist_ok=True)
+    args = [chrome_binary(),
+            "--headless=new",
+            f"--remote-debugging-port={port}",
+            f"--user-data-dir={profile_dir}",
+            f"--disk-cache-dir={os.path.join(profile_dir, 'cache')}",
+            f"--disk-cache-size={CHROME_CACHE_MB * 1024 * 1024}",
+            f"--user-agent={USER_AGENT}",
+            "--disable-gpu",
+            "--no-sandbox",
+            "--disable-extensions",
+            "--no-first-run",
+            "--window-size=1920,1080",
+            "about:blank"]
+    # its own session, so the browser outlives this script and the job step that started it
+    subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if debugger_ready(address):
+            return address
+        time.sleep(0.2)
+    raise TimeoutError(f"Chrome did not open its debugging port {address}")
+
+
+def host_pid(port=CHROME_PORT, profile_dir=CHROME_PROFILE_DIR):
+    # pid of the shared browser, Chrome links SingletonLock in its profile to "<hostname>-<pid>"
+    try:
+        pid = int(os.readlink(os.path.join(profile_dir, "SingletonLock")).rsplit("-", 1)[1])
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read()
+    except (OSError, IndexError, ValueError):
+        return None
+    return pid if f"--remote-debugging-port={port}".encode() in cmdline else None
+
+
+def address_port(address):
+    return int(address.rsplit(":", 1)[1])
+
+
+def ensure_chrome(address):
+    # the shared browser may have died, start it again on the same port
+    if not debugger_ready(address):
+        print(f"No Chrome at {address}, starting it again")
+        start_chrome(port=address_port(address))
+
+
+def attach(address, page_load_strategy="normal"):
+    # every session drives its own tab, so several scripts and pool workers can share one browser
+    options = webdriver.ChromeOptions()
+    options.debugger_address = address
+    options.page_load_strategy = page_load_strategy
+    driver = AttachedChrome(options=options)
+    driver.switch_to.new_window("tab")
+    return driver
+
+
+if __name__ == "__main__":
+    # python chrome_host.py >> "$GITHUB_ENV" makes the later steps of the job attach to it
+    started = time.perf_counter()
+    chrome_address = start_chrome()
+    print(f"Chrome ready at {chrome_address} in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    print(f"CHROME_DEBUGGER_ADDRESS={chrome_address}")
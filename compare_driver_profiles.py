@@ -0,0 +1,85 @@
+# compare_driver_profiles.py
+import json
+import sys
+import time
+from urllib.parse import urlparse
+
+from selenium.common.exceptions import TimeoutException
+
+from google_form_package import Sheet
+from page_readiness import wait_until_ready
+
+SAMPLE_URLS = [
+    "https://www.workforceaustralia.gov.au/individuals/jobs/search?locationCodes%5B0%5D=7&jobAge=3&pageNumber=1",
+    "https://www.yourcareer.gov.au/occupations?address%5Bstate%5D=VIC&pageNumber=1",
+]
+# readiness condition per sample host, other urls only wait for the network to go quiet
+SAMPLE_PAGES = {"www.workforceaustralia.gov.au": "vacancy_listing", "www.yourcareer.gov.au": "occupation_listing"}
+# seconds without a new request or response before the totals are read
+QUIET_FOR = 1
+QUIET_TIMEOUT = 30
+
+
+def network_totals(entries):
+    # (requests, bytes over the wire) from DevTools performance log entries; Resource Timing reports
+    # 0 bytes for cross-origin resources without Timing-Allow-Origin, the third parties the profile blocks
+    requests_made = 0
+    transferred = 0
+    for entry in entries:
+        message = json.loads(entry["message"])["message"]
+        if message["method"] == "Network.loadingFinished":
+            requests_made += 1
+            transferred += message["params"].get("encodedDataLength", 0)
+    return requests_made, transferred
+
+
+def settled_totals(driver, poll=0.1):
+    # eager loading returns before the subresources, keep collecting until the log stays empty for QUIET_FOR
+    entries = []
+    deadline = time.monotonic() + QUIET_TIMEOUT
+    quiet_since = time.monotonic()
+    while time.monotonic() < deadline and time.monotonic() - quiet_since < QUIET_FOR:
+        new_entries = driver.get_log("performance")
+        if new_entries:
+            quiet_since = time.monotonic()
+            entries.extend(new_entries)
+        time.sleep(poll)
+    return network_totals(entries)
+
+
+def measure(profile, urls):
+    driver = Sheet.set_driver(profile, log_network=True)
+    results = []
+    try:
+        for url in urls:
+            # drops what is left from the previous url
+            driver.get_log("performance")
+            started = time.perf_counter()
+            driver.get(url)
+            page = SAMPLE_PAGES.get(urlparse(url).netloc)
+            if page:
+                try:
+                    wait_until_ready(driver, page, elements=False)
+                except TimeoutException:
+                    print(f"{url} was not ready, the totals may be short")
+            elapsed = time.perf_counter() - started
+            requests_made, transferred = settled_totals(driver)
+            results.append((url, elapsed, requests_made, transferred))
+    finally:
+        driver.quit()
+    return results
+
+
+def main():
+    # usage: python compare_driver_profiles.py [url ...], without CHROME_DEBUGGER_ADDRESS so each profile launches
+    urls = sys.argv[1:] or SAMPLE_URLS
+    full = measure("full", urls)
+    scrape = measure("scrape", urls)
+    for (url, full_time, full_requests, full_bytes), (_, scrape_time, scrape_requests, scrape_bytes) in zip(full, scrape):
+        print(url)
+        print(f"  full:   {full_time:6.2f}s {full_requests:4d} requests {full_bytes / 1024:9.1f} KB")
+        print(f"  scrape: {scrape_time:6.2f}s {scrape_requests:4d} requests {scrape_bytes / 1024:9.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
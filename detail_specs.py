@@ -0,0 +1,242 @@
+# detail_specs.py
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import lxml.html
+
+# online: evaluate specs in the browser; offline: capture page_source and parse it with lxml on a process pool
+PARSE_MODE = os.environ.get("PARSE_MODE", "online")
+
+# Each field lists rules tried in order; the first rule whose element exists produces the value.
+#   css / xpath  where to start
+#   where        [selector, text]: keep the first start element whose selector match contains text
+#   closest      walk up to this ancestor
+#   within       step down to the first match of this selector
+#   all          collect every match of this selector and join them
+#   property     "text" (rendered text, trimmed), "textContent" or any DOM property such as "href"
+#   remove       text stripped from the value, e.g. a "Company:" label
+#   skip_empty / wrap / join   how collected values are cleaned, wrapped and joined
+# "default" is used when no rule matches, "empty" when an "all" rule matched nothing.
+
+VACANCY_DETAIL_SPEC = [
+    {"name": "company", "default": "No company given", "rules": [
+        {"xpath": "//p[b[contains(text(), 'Company:')]]", "remove": "Company:"},
+        {"xpath": "//*[@id='find-a-job']//div[contains(@class, 'text-lg')]//p/a"},
+    ]},
+    {"name": "address", "default": "No address given", "rules": [
+        {"css": "div[class='address-text']"},
+    ]},
+    {"name": "salary", "default": "No salary given", "rules": [
+        {"css": "ul.job-info-metadata > li:nth-child(2) > span:nth-of-type(2)"},
+    ]},
+    {"name": "tenure", "default": "No tenure given", "rules": [
+        {"css": "ul.job-info-metadata > li:nth-child(3) > span:nth-of-type(2)"},
+    ]},
+    {"name": "closes", "default": "No close time given", "rules": [
+        {"css": "ul.job-info-metadata > li:nth-child(4) > span:nth-child(2)"},
+    ]},
+    {"name": "description", "default": "No description given", "rules": [
+        {"css": "div.card-copy", "where": ["h2", "Job description"], "all": "p", "join": "\n"},
+    ]},
+]
+
+# the directions link is needed before the driver moves on, so it is kept out of the offline parse
+VACANCY_MAP_SPEC = [
+    {"name": "map_link", "default": None, "rules": [
+        {"css": "a[class='custom mint-button secondary direction-btn']", "property": "href"},
+    ]},
+]
+
+OCCUPATION_DETAIL_SPEC = [
+    {"name": "description", "default": "No description given", "rules": [
+        {"css": "div[class='text-lg']"},
+    ]},
+    {"name": "average_salary", "default": "No average salary given", "rules": [
+        {"css": "h3[identifer='Occupation_Insights_Average_Salary'] ~ p"},
+    ]},
+    {"name": "future_demand", "default": "No future demand given", "rules": [
+        {"css": "h3[identifer='Occupation_Insights_Future_Demand']", "closest": "li",
+         "within": "span[class='mint-pill__content-label']"},
+    ]},
+    {"name": "job_type", "default": "No job type given", "rules": [
+        {"css": "h3[identifer='Occupation_Insights_Job_Type'] ~ p"},
+    ]},
+    {"name": "skill_level", "default": "No skill level given", "rules": [
+        {"css": "h3[identifer='Occupation_Insights_Skill_Level'] ~ p"},
+    ]},
+    {"name": "industry", "default": "No industry given", "rules": [
+        {"css": "ul[class='industry-link-list']", "all": "a[class='mint-link']", "join": ", \n"},
+    ]},
+    {"name": "apprenticeships_and_traineeships", "default": "No Apprenticeships and traineeships given",
+     "empty": "No Apprenticeships and traineeships given", "rules": [
+        {"css": "ul.list-inline", "all": "span.mint-pill__content-label", "skip_empty": True, "join": ", \n"},
+    ]},
+    {"name": "overview_interests", "default": "No interests given", "rules": [
+        {"css": "h3[identifier='Interests_Stories_Heading'] ~ ul", "all": "span[class='mint-pill__content-label']",
+         "join": ", \n"},
+    ]},
+    {"name": "overview_considerations", "default": "No considerations given", "rules": [
+        {"css": "h3[identifier='Considerations_Stories_Heading'] ~ ul",
+         "all": "span[class='mint-pill__content-label']", "join": ", \n"},
+    ]},
+    {"name": "overview_day_to_day", "default": "No day-to-day given", "rules": [
+        {"css": "h3[identifier='Day_to_day_Stories_Heading'] ~ ul", "all": "li", "wrap": "'{}'", "join": ",\n"},
+    ]},
+]
+
+SKILLS_SPEC = [
+    {"name": "skills", "default": "No skills given", "rules": [
+        {"css": "p[identifier='Skills_Top_Skills_Requested'] ~ ul", "all": "span[class='mint-pill__content-label']",
+         "property": "textContent", "join": ", "},
+    ]},
+]
+
+# the whole spec is evaluated inside the page, one WebDriver round-trip per detail page
+SPEC_SCRIPT = """
+const spec = arguments[0];
+const read = (element, property) => {
+    if (property === 'text') return (element.innerText || '').trim();
+    const value = element[property];
+    return value === undefined || value === null ? '' : String(value);
+};
+const start = rule => {
+    if (rule.xpath) {
+        const found = document.evaluate(rule.xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        return Array.from({length: found.snapshotLength}, (_, i) => found.snapshotItem(i));
+    }
+    return Array.from(document.querySelectorAll(rule.css));
+};
+const apply = (rule, field) => {
+    let elements = start(rule);
+    if (rule.where) {
+        elements = elements.filter(element => {
+            const marker = element.querySelector(rule.where[0]);
+            return marker && marker.innerText.includes(rule.where[1]);
+        });
+    }
+    let element = elements[0];
+    if (element && rule.closest) element = element.closest(rule.closest);
+    if (element && rule.within) element = element.querySelector(rule.within);
+    if (!element) return undefined;
+    const property = rule.property || 'text';
+    if (rule.all) {
+        let values = Array.from(element.querySelectorAll(rule.all), item => read(item, property));
+        if (rule.skip_empty) values = values.filter(value => value.trim() !== '');
+        if (rule.wrap) values = values.map(value => rule.wrap.replace('{}', value));
+        if (!values.length && field.empty !== undefined) return field.empty;
+        return values.join(rule.join === undefined ? ', ' : rule.join);
+    }
+    let value = read(element, property);
+    if (rule.remove) value = value.replace(rule.remove, '').trim();
+    return value;
+};
+const result = {};
+for (const field of spec) {
+    result[field.name] = field.default;
+    for (const rule of field.rules) {
+        try {
+            const value = apply(rule, field);
+            if (value !== undefined) {
+                result[field.name] = value;
+                break;
+            }
+        } catch (error) {
+            // a rule that throws falls through to the next fallback rule
+            continue;
+        }
+    }
+}
+return result;
+"""
+
+
+def extract_fields(driver, spec):
+    # {field name: value} for every field in the spec
+    return driver.execute_script(SPEC_SCRIPT, spec)
+
+
+def rendered_text(element):
+    # close to innerText: whitespace collapsed per line, blank lines dropped
+    lines = (re.sub(r"\s+", " ", line).strip() for line in element.text_content().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def read_offline(element, prop):
+    if prop == "text":
+        return rendered_text(element)
+    if prop == "textContent":
+        return element.text_content()
+    return element.get(prop) or ""
+
+
+def apply_offline(tree, rule, field):
+    # lxml twin of apply() in SPEC_SCRIPT
+    elements = tree.xpath(rule["xpath"]) if "xpath" in rule else tree.cssselect(rule["css"])
+    if "where" in rule:
+        selector, text = rule["where"]
+        elements = [element for element in elements
+                    if element.cssselect(selector) and text in rendered_text(element.cssselect(selector)[0])]
+    element = elements[0] if elements else None
+    if element is not None and "closest" in rule:
+        element = element if element.tag == rule["closest"] else next(element.iterancestors(rule["closest"]), None)
+    if element is not None and "within" in rule:
+        matches = element.cssselect(rule["within"])
+        element = matches[0] if matches else None
+    if element is None:
+        return None
+    prop = rule.get("property", "text")
+    if "all" in rule:
+        values = [read_offline(item, prop) for item in element.cssselect(rule["all"])]
+        if rule.get("skip_empty"):
+            values = [value for value in values if value.strip() != ""]
+        if "wrap" in rule:
+            values = [rule["wrap"].replace("{}", value) for value in values]
+        if not values and "empty" in field:
+            return field["empty"]
+        return rule.get("join", ", ").join(values)
+    value = read_offline(element, prop)
+    if "remove" in rule:
+        value = value.replace(rule["remove"], "", 1).strip()
+    return value
+
+
+def evaluate_spec(html, spec, base_url=None):
+    # same result as extract_fields, computed from captured HTML without a browser
+    tree = lxml.html.fromstring(html or "<html></html>", base_url=base_url)
+    if base_url:
+        tree.make_links_absolute(base_url)
+    result = {}
+    for field in spec:
+        result[field["name"]] = field["default"]
+        for rule in field["rules"]:
+            try:
+                value = apply_offline(tree, rule, field)
+            except Exception:
+                continue
+            if value is not None:
+                result[field["name"]] = value
+                break
+    return result
+
+
+parser_pool = None
+parser_pool_lock = threading.Lock()
+
+
+def parse_later(html, spec, base_url=None):
+    # returns a Future of the evaluated spec, parsing runs on another core
+    global parser_pool
+    with parser_pool_lock:
+        if parser_pool is None:
+            # forking would copy the sheet client, the browser sessions and held locks from a threaded parent;
+            # spawned workers only import this module (and the script's guarded top level)
+            parser_pool = ProcessPoolExecutor(max_workers=int(os.environ.get("PARSE_WORKERS", os.cpu_count() or 1)),
+                                              mp_context=multiprocessing.get_context("spawn"))
+    return parser_pool.submit(evaluate_spec, html, spec, base_url)
+
+
+def resolve(value):
+    return value.result() if isinstance(value, Future) else value
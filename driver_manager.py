@@ -0,0 +1,123 @@
+# driver_manager.py
+import os
+
+# a long-lived Chrome grows and slows down, it is replaced after this many pages or this much RSS
+DRIVER_MAX_PAGES = int(os.environ.get("DRIVER_MAX_PAGES", 300))
+DRIVER_MAX_RSS_MB = int(os.environ.get("DRIVER_MAX_RSS_MB", 1500))
+# reading /proc for the whole process tree is cheap but not free
+RSS_CHECK_EVERY = 10
+# set when the drivers are tabs in one Chrome started by chrome_host.py
+CHROME_DEBUGGER_ADDRESS = os.environ.get("CHROME_DEBUGGER_ADDRESS")
+
+
+def process_tree(root_pid):
+    # root_pid and every descendant, from the parent pids in /proc/*/stat
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # the command name may contain spaces, the fields after it do not
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    pids = [root_pid]
+    for pid in pids:
+        pids.extend(children.get(pid, []))
+    return pids
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return 0
+
+
+class DriverManager:
+    def __init__(self, driver_factory, max_pages=DRIVER_MAX_PAGES, max_rss_mb=DRIVER_MAX_RSS_MB, restarts=2):
+        self.driver_factory = driver_factory
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.restarts = restarts
+        self.driver = None
+        self.pages = 0
+
+    def get(self):
+        if self.driver is None:
+            if CHROME_DEBUGGER_ADDRESS:
+                from chrome_host import ensure_chrome
+
+                ensure_chrome(CHROME_DEBUGGER_ADDRESS)
+            self.driver = self.driver_factory()
+            self.pages = 0
+        return self.driver
+
+    def chrome_rss_mb(self):
+        # chromedriver plus every Chrome process under it, None when the browser cannot be found
+        if not os.path.isdir("/proc"):
+            return None
+        if CHROME_DEBUGGER_ADDRESS:
+            from chrome_host import address_port, host_pid
+
+            # the shared browser is not a child of chromedriver, its own process tree is measured
+            root_pid = host_pid(address_port(CHROME_DEBUGGER_ADDRESS))
+        else:
+            service = getattr(self.driver, "service", None)
+            process = getattr(service, "process", None)
+            root_pid = process.pid if process else None
+        if root_pid is None:
+            return None
+        return sum(rss_mb(pid) for pid in process_tree(root_pid))
+
+    def alive(self):
+        try:
+            self.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def run(self, func, *args):
+        # func(driver, *args); a crashed Chrome is replaced and the same work item is tried again
+        for attempt in range(self.restarts + 1):
+            driver = self.get()
+            try:
+                result = func(driver, *args)
+            except Exception as e:
+                # timeouts and missing elements leave a working browser, those are the caller's problem
+                if self.alive() or attempt == self.restarts:
+                    raise
+                print(f"Chrome crashed ({type(e).__name__}), restarting and retrying the current page")
+                self.quit()
+                continue
+            self.pages += 1
+            self.check()
+            return result
+
+    def check(self):
+        reason = None
+        if self.max_pages and self.pages >= self.max_pages:
+            reason = f"{self.pages} pages"
+        elif self.max_rss_mb and self.pages % RSS_CHECK_EVERY == 0:
+            rss = self.chrome_rss_mb()
+            if rss and rss >= self.max_rss_mb:
+                reason = f"{rss} MB RSS"
+        if reason:
+            print(f"Recycling Chrome after {reason}")
+            # the next run() starts a fresh browser; attached, only our own tab is closed and reopened,
+            # the shared browser keeps the other processes' tabs
+            self.quit()
+
+    def quit(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                print(f"Chrome did not quit cleanly: {type(e).__name__}")
+            self.driver = None
@@ -1,32 +1,85 @@
 # google_form_package.py
+import asyncio
+import json
 import os  # noqa
+import re
 import time
 import gspread
+from google.auth.transport.requests import AuthorizedSession
 from google.oauth2.service_account import Credentials
-from selenium import webdriver
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+from gspread.utils import rowcol_to_a1
+from requests.adapters import HTTPAdapter
+
+from background_writer import BackgroundWriter
+from output_sink import with_retry
+from quota_governor import QuotaGovernor
+from snapshot_cache import SnapshotCache
+
+SPREADSHEET_KEY = "13fIG9eUVVH1OKkQ6CaaTNSr1Cb8eUg-qCNXxm9m7eu0"
+ROW_WINDOW = 2000
+
+# "scrape" skips everything the scrapers never read, "full" loads pages as a normal browser would
+DRIVER_PROFILE = os.environ.get("DRIVER_PROFILE", "full")
+# host:port of a Chrome started by chrome_host.py, set_driver then opens a tab in it instead of launching one
+CHROME_DEBUGGER_ADDRESS = os.environ.get("CHROME_DEBUGGER_ADDRESS")
+BLOCKED_URL_PATTERNS = [
+    # images, fonts and media
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3", "*.m4a",
+    # analytics and third-party trackers
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*facebook.net*",
+    "*hotjar.com*", "*clarity.ms*", "*newrelic.com*", "*nr-data.net*", "*youtube.com/embed*",
+]
+
+class GovernedHTTPClient(HTTPClient):
+    def __init__(self, auth, session=None):
+        super().__init__(auth, session)
+        self.governor = None
+        self.on_write = None
+
+    def request(self, method, endpoint, *args, **kwargs):
+        # meter every call against the per-minute quota before it is sent
+        kind = "read" if method.lower() == "get" else "write"
+        if self.governor:
+            self.governor.acquire(kind)
+        try:
+            response = super().request(method, endpoint, *args, **kwargs)
+        except APIError as e:
+            if self.governor and e.code == 429:
+                self.governor.exhaust(kind)
+            raise
+        if kind == "write" and self.on_write:
+            self.on_write()
+        return response
 
 class Sheet:
     def __init__(self):
+        started = time.perf_counter()
         # This is for GitHub action
         key_content = os.environ.get("SERVICE_ACCOUNT_KEY")
         if not key_content:
             raise FileNotFoundError("Service account key content not found in environment variable!")
 
-        key_path = "service_account.json"
-        with open(key_path, "w") as f:
-            f.write(key_content)
         scopes = [
             'https://www.googleapis.com/auth/spreadsheets',
             'https://www.googleapis.com/auth/drive'
         ]
-        credentials = Credentials.from_service_account_file(key_path, scopes=scopes)
-        gc = gspread.authorize(credentials)
-        spreadsheet_url = "https://docs.google.com/spreadsheets/d/13fIG9eUVVH1OKkQ6CaaTNSr1Cb8eUg-qCNXxm9m7eu0/edit?gid=0#gid=0"
+        # the key is parsed in memory, nothing is written to disk
+        credentials = Credentials.from_service_account_info(json.loads(key_content), scopes=scopes)
+        # one keep-alive pool is shared by the scrape loop and the background writer
+        session = AuthorizedSession(credentials)
+        session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+        self.governor = QuotaGovernor()
+        gc = gspread.authorize(credentials, http_client=GovernedHTTPClient, session=session)
+        gc.http_client.governor = self.governor
         retries = 3
         delay = 5
         for attempt in range(retries):
             try:
-                self.spreadsheet = gc.open_by_url(spreadsheet_url)
+                self.spreadsheet = gc.open_by_key(SPREADSHEET_KEY)
                 break
             except gspread.exceptions.APIError as e:
                 if "429" in str(e):
@@ -37,20 +90,129 @@ class Sheet:
                     raise
         else:
             raise Exception("Failed to open spreadsheet after multiple attempts due to quota limits.")
+        self.snapshot_cache = SnapshotCache()
+        self.worksheets = None
+        self.headers = {}
+        self.writer = BackgroundWriter()
+        # Drive's modified time can lag our own writes, so drop our snapshots whenever we write
+        gc.http_client.on_write = lambda: self.snapshot_cache.invalidate(self.spreadsheet.id)
+        print(f"Sheet ready in {time.perf_counter() - started:.2f}s")
 
     @staticmethod
-    def set_driver():
-        # set options and driver settings
-        user_agent = f"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36"
-        options = webdriver.ChromeOptions()
-        options.add_argument(f"user-agent={user_agent}")
-        options.add_argument("--headless")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-extensions")
-        options.add_argument('--start-maximized')
-        driver = webdriver.Chrome(options=options)
+    def set_driver(profile=None, log_network=False):
+        # selenium is only imported by the processes that drive a browser
+        from selenium import webdriver
+
+        profile = profile or DRIVER_PROFILE
+
+        if CHROME_DEBUGGER_ADDRESS:
+            from chrome_host import attach
+
+            # launch flags and prefs belong to the shared browser, only the session settings apply here
+            driver = attach(CHROME_DEBUGGER_ADDRESS, "eager" if profile == "scrape" else "normal")
+        else:
+            # set options and driver settings
+            user_agent = f"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36"
+            options = webdriver.ChromeOptions()
+            options.add_argument(f"user-agent={user_agent}")
+            options.add_argument("--headless")
+            options.add_argument("--disable-gpu")
+            options.add_argument("--no-sandbox")
+            options.add_argument("--disable-extensions")
+            options.add_argument('--start-maximized')
+            if log_network:
+                # DevTools network events, read back with driver.get_log("performance")
+                options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+            if profile == "scrape":
+                # hand the page over once the DOM is parsed, the scrapers wait for their own elements
+                options.page_load_strategy = "eager"
+                options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+            driver = webdriver.Chrome(options=options)
+        if profile == "scrape":
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
         return driver
 
     def get_worksheet(self, sheet_name):
-        return self.spreadsheet.worksheet(sheet_name)
+        # one metadata fetch resolves every worksheet for the rest of the run
+        if self.worksheets is None or sheet_name not in self.worksheets:
+            self.worksheets = {worksheet.title: worksheet for worksheet in self.spreadsheet.worksheets()}
+        if sheet_name not in self.worksheets:
+            raise gspread.exceptions.WorksheetNotFound(sheet_name)
+        return self.worksheets[sheet_name]
+
+    def submit(self, func, *args, **kwargs):
+        # queue a write so the next page can load while this one is flushed
+        return self.writer.submit(func, *args, **kwargs)
+
+    async def submit_async(self, func, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def flush(self):
+        self.writer.flush()
+
+    def get_all_values_cached(self, worksheet):
+        # full-sheet reads are shared on disk while the spreadsheet revision is unchanged
+        revision = self.spreadsheet.get_lastUpdateTime()
+        key = f"{self.spreadsheet.id}_{worksheet.id}"
+        return self.snapshot_cache.get(key, revision, worksheet.get_all_values)
+
+    def get_header(self, worksheet):
+        # header rows are resolved once per worksheet
+        if worksheet.id not in self.headers:
+            self.load_headers([worksheet] + [cached for cached in (self.worksheets or {}).values()
+                                             if cached.id not in self.headers])
+        return self.headers[worksheet.id]
+
+    def load_headers(self, worksheets):
+        # row 1 of every known worksheet comes back in a single values_batch_get
+        ranges = [f"'{worksheet.title}'!1:1" for worksheet in worksheets]
+        response = self.spreadsheet.values_batch_get(ranges)
+        for worksheet, value_range in zip(worksheets, response.get("valueRanges", [])):
+            values = value_range.get("values", [])
+            self.headers[worksheet.id] = values[0] if values else []
+
+    def read_columns(self, worksheet, header_names):
+        # fetch only the named columns below the header, returned as parallel lists
+        header = self.get_header(worksheet)
+        ranges = []
+        for name in header_names:
+            letter = re.sub(r"\d+", "", rowcol_to_a1(1, header.index(name) + 1))
+            ranges.append(f"'{worksheet.title}'!{letter}2:{letter}")
+        response = self.spreadsheet.values_batch_get(ranges, params={"majorDimension": "COLUMNS"})
+        columns = []
+        for value_range in response.get("valueRanges", []):
+            values = value_range.get("values", [])
+            columns.append(values[0] if values else [])
+        # the API drops trailing empty cells, so pad every column to the same length
+        length = max((len(column) for column in columns), default=0)
+        return [column + [""] * (length - len(column)) for column in columns]
+
+    def iter_rows(self, worksheet, header_names=None, window=ROW_WINDOW):
+        # yield (row_num, values) below the header one fixed window at a time, e.g. A2:P2001 then A2002:P4001
+        header = self.get_header(worksheet)
+        names = header_names or header
+        letters = [re.sub(r"\d+", "", rowcol_to_a1(1, header.index(name) + 1)) for name in names]
+        start = 2
+        while True:
+            end = start + window - 1
+            if header_names:
+                ranges = [f"'{worksheet.title}'!{letter}{start}:{letter}{end}" for letter in letters]
+            else:
+                ranges = [f"'{worksheet.title}'!A{start}:{letters[-1]}{end}"]
+            # the generator is read lazily over hours, so a 429 or 5xx on a later window is retried here
+            response = with_retry(self.spreadsheet.values_batch_get, ranges,
+                                  params={"majorDimension": "COLUMNS" if header_names else "ROWS"})
+            value_ranges = [value_range.get("values", []) for value_range in response.get("valueRanges", [])]
+            if header_names:
+                columns = [values[0] if values else [] for values in value_ranges]
+                length = max((len(column) for column in columns), default=0)
+                rows = [[column[i] if i < len(column) else "" for column in columns] for i in range(length)]
+            else:
+                rows = value_ranges[0] if value_ranges else []
+            for offset, row in enumerate(rows):
+                yield start + offset, row + [""] * (len(names) - len(row))
+            # the API drops trailing empty rows, so a short window is the end of the data
+            if len(rows) < window:
+                return
+            start = end + 1
@@ -0,0 +1,80 @@
+# keyed_upsert.py
+import os
+import re
+import threading
+
+# rewrite: every run clears the tables and fills them again; upsert: rows are matched by key, only changes are written
+STORAGE_MODE = os.environ.get("STORAGE_MODE", "rewrite")
+# rows that left the listing are kept and marked with this instead of being deleted
+CLOSED_PREFIX = "Closed"
+
+HYPERLINK = re.compile(r'^=HYPERLINK\("((?:[^"\\]|\\.)*)"')
+
+
+def plain(value):
+    # the sheet reads formulas back as their result, =HYPERLINK("url", "url") compares as url
+    value = str(value)
+    match = HYPERLINK.match(value)
+    return match.group(1).replace('\\"', '"') if match else value
+
+
+class KeyedUpsert:
+    def __init__(self, sink, table, record_cls, key_field, volatile=(), placeholder=None):
+        self.sink = sink
+        self.table = table
+        self.record_cls = record_cls
+        self.key_field = key_field
+        # fields that change on every run, e.g. the scrape time, are not worth a write
+        self.volatile = set(volatile)
+        # a key value meaning "no key", such records are always appended
+        self.placeholder = placeholder
+        self.rows = {}
+        for row_num, values in sink.iter_rows(table):
+            record = record_cls.from_row(values)
+            key = getattr(record, key_field)
+            if key and key != placeholder:
+                self.rows.setdefault(key, (row_num, record))
+        self.seen = set()
+        # crawler threads share one upsert
+        self.lock = threading.Lock()
+        print(f"{len(self.rows)} existing {table} rows indexed by {key_field}")
+
+    def split(self, records):
+        # ([rows to append], [(row_num, [(col, value)])] to update) for a batch of freshly scraped records
+        new_rows = []
+        updates = []
+        with self.lock:
+            for record in records:
+                key = getattr(record, self.key_field)
+                if not key or key == self.placeholder:
+                    new_rows.append(record.to_row())
+                    continue
+                if key in self.seen:
+                    continue
+                self.seen.add(key)
+                if key not in self.rows:
+                    new_rows.append(record.to_row())
+                    continue
+                row_num, stored = self.rows[key]
+                changes = self.changes(record, stored)
+                if changes:
+                    updates.append((row_num, changes))
+        return new_rows, updates
+
+    def changes(self, record, stored):
+        # only the fields this stage fills in, the later stages own the rest of the row
+        changes = []
+        for col, value in record.diff(stored):
+            field = self.record_cls.FIELDS[col - 1]
+            if value != "" and field not in self.volatile and plain(value) != plain(getattr(stored, field)):
+                changes.append((col, value))
+        for col, field in enumerate(self.record_cls.FIELDS, 1):
+            # a row marked closed that is listed again is open, its marker is cleared
+            if getattr(record, field) == "" and str(getattr(stored, field)).startswith(CLOSED_PREFIX):
+                changes.append((col, ""))
+        return changes
+
+    def missing(self):
+        # stored rows whose key did not come up in this run, as [(row_num, record)]
+        with self.lock:
+            return [self.rows[key] for key in self.rows if key not in self.seen]
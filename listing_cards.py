@@ -0,0 +1,50 @@
+# listing_cards.py
+from page_readiness import READY_CONDITIONS
+
+# a field the card does not have comes back as None, so callers can tell "missing" from ""
+MISSING = None
+
+NEXT_PAGE_SELECTOR = "button[aria-label='Go to next page']"
+
+# (name, selector inside the card, "text" or a DOM property such as "href")
+VACANCY_CARD_FIELDS = [
+    ("job_title", "a[class='mint-link link']", "text"),
+    ("job_href", "a[class='mint-link link']", "href"),
+    ("preheading", "div[class='preheading']", "text"),
+    ("overview", "div.mint-blurb", "text"),
+]
+
+OCCUPATION_CARD_FIELDS = [
+    ("vacancy_url", "a[rel='nofollow']", "href"),
+    ("vacancy_count", "a[target='_blank']", "text"),
+    ("courses_url", "a[aria-label^='Explore courses'], a[aria-label^='View course']", "href"),
+    ("occupation_name", "a[class='link mint-link link']", "text"),
+    ("detail_url", "a[class='link mint-link link']", "href"),
+]
+
+# every card and the next-page check come back from a single WebDriver call
+LISTING_SCRIPT = """
+const [cardSelector, fields, nextSelector] = arguments;
+const cards = Array.from(document.querySelectorAll(cardSelector), card => {
+    const values = {};
+    for (const [name, selector, property] of fields) {
+        const element = card.querySelector(selector);
+        if (!element) {
+            values[name] = null;
+        } else if (property === 'text') {
+            values[name] = element.innerText.trim();
+        } else {
+            values[name] = element[property];
+        }
+    }
+    return values;
+});
+return {cards: cards, hasNext: !!document.querySelector(nextSelector)};
+"""
+
+
+def extract_listing(driver, page, fields, next_selector=NEXT_PAGE_SELECTOR):
+    # returns ([{field: value or MISSING}, ...], has_next_page)
+    result = driver.execute_script(LISTING_SCRIPT, READY_CONDITIONS[page]["selector"],
+                                   [list(field) for field in fields], next_selector)
+    return result["cards"], result["hasNext"]
@@ -6,15 +6,28 @@ import time
 import gspread
 from requests.exceptions import ReadTimeout
 from selenium.common.exceptions import NoSuchElementException, TimeoutException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
 
+from detail_specs import (OCCUPATION_DETAIL_SPEC, PARSE_MODE, SKILLS_SPEC, evaluate_spec, extract_fields, parse_later,
+                          resolve)
 from google_form_package import Sheet
+from output_sink import open_sink
+from page_cache import open_page_cache
+from page_fetcher import PageFetcher
+from page_readiness import polite_get, wait_until_ready
 from process_handler import ProcessHandler
+from records import Occupation
 
-web_sheet = Sheet()
-driver = web_sheet.set_driver()
+# the spawned parse workers import this file as __mp_main__, only the run itself opens the sheet and Chrome
+if __name__ == "__main__":
+    web_sheet = Sheet()
+    sink = open_sink(web_sheet)
+    driver = web_sheet.set_driver()
+    fetcher = PageFetcher(driver, cache=open_page_cache())
+
+SKILLS_SELECTOR = "p[identifier='Skills_Top_Skills_Requested'] ~ ul"
+FAILED_VALUE = "Failed to load detail page"
+FAILED_FIELDS = dict({field["name"]: FAILED_VALUE for field in OCCUPATION_DETAIL_SPEC},
+                     description="Failed to find description")
 
 def get_worksheet_with_retry(sheet_name, retries=3, delay=5):
     for attempt in range(retries):
@@ -30,16 +43,6 @@ def get_worksheet_with_retry(sheet_name, retries=3, delay=5):
                 raise
     raise Exception(f"Failed to get worksheet {sheet_name} after {retries} attempts.")
 
-def wait_for_page_load(wait_driver, timeout=15):
-    try:
-        WebDriverWait(wait_driver, timeout).until(
-            lambda d: d.execute_script("return document.readyState") == "complete"
-        )
-    except TimeoutException:
-        print("Page loading timeout.")
-    except Exception as e:
-        print(f"An error occurred while waiting for page load: {e}")
-
 def remove_hyperlink(cell_value):
     # remove hyper link
     if cell_value.startswith('=HYPERLINK('):
@@ -49,20 +52,17 @@ def remove_hyperlink(cell_value):
             return match.group(1)
     return cell_value
 
-def extract(occ_sheet):
-    # extract from Sheet1
-    occ_sheet_header = occ_sheet.row_values(1)
+def extract():
+    # extract occupation links
     try:
-        link_idx = occ_sheet_header.index("occupation link") + 1
+        link_column = sink.read_columns("Occupation", ["occupation link"])[0]
     except ValueError as e:
         print("Could not detect requested row", e)
         return
 
-    all_rows = occ_sheet.get_all_values()[1:]
     link_list = []
 
-    for row_num, row in enumerate(all_rows, start=2):
-        link = row[link_idx - 1] if len(row) >= link_idx else ""
+    for row_num, link in enumerate(link_column, start=2):
         detail_url = remove_hyperlink(link)
         if not detail_url:
             break
@@ -74,66 +74,43 @@ def overview_to_skills(link):
     modified_link = re.sub(r"(\?|&)tab=overview", r"\1tab=skills", link)
     return modified_link
 
-def batch_update_multiple_rows(worksheet, updates_list, retries=3, delay=10):
-    sheet_id = getattr(worksheet, 'id', None) or worksheet._properties.get('sheetId')
-    requests = []
-    for row_num, updates in updates_list:
-        for col, value in updates:
-            requests.append({
-                "updateCells": {
-                    "range": {
-                        "sheetId": sheet_id,
-                        "startRowIndex": row_num - 1,
-                        "endRowIndex": row_num,
-                        "startColumnIndex": col - 1,
-                        "endColumnIndex": col
-                    },
-                    "rows": [{
-                        "values": [{
-                            "userEnteredValue": {"stringValue": str(value)}
-                        }]
-                    }],
-                    "fields": "userEnteredValue"
-                }
-            })
-    body = {"requests": requests}
-
-    for attempt in range(retries):
+def scrape_skills(detail_url):
+    # skills tab over plain HTTP when it is server rendered, read with the same spec as the browser would
+    skills_url = overview_to_skills(detail_url)
+    skills = fetcher.cached_fields(skills_url, "occupation_skills", SKILLS_SPEC)
+    if skills is not None:
+        return skills
+    try:
+        skills_page = fetcher.fetch(skills_url, SKILLS_SELECTOR)
+    except Exception as e:
+        print(f"Error loading skills tab: {e}")
+        return {"skills": "Failed to load skills page"}
+    if PARSE_MODE == "offline":
+        skills = parse_later(skills_page.text, SKILLS_SPEC, skills_page.url)
+    else:
+        skills = evaluate_spec(skills_page.text, SKILLS_SPEC, skills_page.url)
+    if skills_page.via != "none":
+        fetcher.remember(skills_url, "occupation_skills", SKILLS_SPEC, skills, page=skills_page)
+    return skills
+
+def write_details(pending_updates):
+    # runs on the sheet writer thread, offline parses are awaited here instead of in the scraping loop
+    updates = []
+    for row_num, (fields, skills) in pending_updates:
         try:
-            worksheet.spreadsheet.batch_update(body)
-            return
-        except gspread.exceptions.APIError as e:
-            if any(code in str(e) for code in ["500", "502", "503", "504"]):
-                print(f"API Error ({e}). Retrying after {delay} seconds... (Attempt {attempt+1}/{retries})")
-                time.sleep(delay)
-                delay *= 2
-            else:
-                raise
-    print("Failed to update cells after several attempts.")
+            values = dict(resolve(fields), **resolve(skills))
+        except Exception as e:
+            # one bad page is written as failed, the rest of the batch still goes out
+            print(f"Failed to parse detail of row {row_num}: {e}")
+            values = dict(FAILED_FIELDS, skills=FAILED_VALUE)
+        updates.append((row_num, sorted((Occupation.column(name), value) for name, value in values.items())))
+    sink.update_cells("Occupation", updates)
 
 def main():
-    occ_sheet = get_worksheet_with_retry("Occupation")
     progress_sheet = get_worksheet_with_retry("Progress")
-    extracted_list = extract(occ_sheet)
-    ph = ProcessHandler(progress_sheet, {"progress": "setting", "RowNum": 4}, "E2")
+    extracted_list = extract()
+    ph = ProcessHandler(progress_sheet, {"progress": "setting", "RowNum": 4}, "E2", shutdown_callback=web_sheet.flush)
     progress = ph.load_progress()
-    occ_sheet_header = occ_sheet.row_values(1)
-    try:
-        col_description = occ_sheet_header.index("description") + 1
-        col_average_salary = occ_sheet_header.index("average salary") + 1
-        col_future_demand = occ_sheet_header.index("future demand") + 1
-        col_job_type = occ_sheet_header.index("job type") + 1
-        col_skill_level = occ_sheet_header.index("skill level") + 1
-        col_industry = occ_sheet_header.index("industry") + 1
-        col_skills = occ_sheet_header.index("skills") + 1
-        col_aat = occ_sheet_header.index("apprenticeships and traineeships") + 1
-        col_overview_interests = occ_sheet_header.index("overview : interests") + 1
-        col_overview_considerations = occ_sheet_header.index("overview : considerations") + 1
-        col_overview_dtd = occ_sheet_header.index("overview : day-to-day") + 1
-
-    except ValueError:
-        print("Column not in sheet")
-        return
     pending_updates = []
     while not progress["progress"] == "finished":
         try:
@@ -144,166 +121,45 @@ def main():
                 extracted_url = row_and_index["detail_url"]
                 url = remove_hyperlink(extracted_url)
                 if extracted_url == "No detail url given":
-                    description = "Failed to find description"
-                    occupation_name = "Failed to find name"
-                    average_salary = "Failed to load detail page"
-                    future_demand = "Failed to load detail page"
-                    job_type = "Failed to load detail page"
-                    skill_level = "Failed to load detail page"
-                    industry = "Failed to load detail page"
-                    overview_interests_text = "Failed to load detail page"
-                    overview_considerations_text = "Failed to load detail page"
-                    dtd = "Failed to load detail page"
-                    skills_text = "Failed to load detail page"
-                    aat = "Failed to load detail page"
-                    print(f"Failed to find {occupation_name} link. Skipping...")
+                    fields = FAILED_FIELDS
+                    skills = {"skills": FAILED_VALUE}
+                    print(f"Failed to find occupation link of row {row_num}. Skipping...")
                     progress["RowNum"] += 5
                 else:
-                    driver.get(url)
-                    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                    wait_for_page_load(driver)
-                    print(f"current page: {url}")
-
-                    # find description
-                    try:
-                        description = WebDriverWait(driver, 15).until(
-                            EC.presence_of_element_located((By.CSS_SELECTOR, "div[class='text-lg']"))
-                        ).text
-                    except (NoSuchElementException,TimeoutException):
-                        description = "No description given"
-
-                    # find average salary
-                    try:
-                        average_salary = driver.find_element(By.CSS_SELECTOR,
-                                                             "h3[identifer='Occupation_Insights_Average_Salary'] ~ p").text
-                    except NoSuchElementException:
-                        average_salary = "No average salary given"
-
-                    # find future demand
-                    try:
-                        raw_future_demand = driver.find_element(By.CSS_SELECTOR,
-                                                                "h3[identifer='Occupation_Insights_Future_Demand']")
-                        li_future_demand = raw_future_demand.find_element(By.XPATH, "./ancestor::li")
-                        future_demand = li_future_demand.find_element(By.CSS_SELECTOR,
-                                                                      "span[class='mint-pill__content-label']").text
-                    except NoSuchElementException:
-                        future_demand = "No future demand given"
-
-                    # find job type
-                    try:
-                        job_type = driver.find_element(By.CSS_SELECTOR,
-                                                       "h3[identifer='Occupation_Insights_Job_Type'] ~ p").text
-                    except NoSuchElementException:
-                        job_type = "No job type given"
+                    # unchanged pages reuse last run's fields and never open in the browser
+                    fields = fetcher.cached_fields(url, "occupation_detail", OCCUPATION_DETAIL_SPEC)
+                    detail_url = url
+                    if fields is not None:
+                        print(f"unchanged since last run: {url}")
+                    else:
+                        polite_get(driver, url)
+                        print(f"current page: {url}")
 
-                    # find skill level
-                    try:
-                        skill_level = driver.find_element(By.CSS_SELECTOR,
-                                                          "h3[identifer='Occupation_Insights_Skill_Level'] ~ p").text
-                    except NoSuchElementException:
-                        skill_level = "No skill level given"
-
-                    # find industry
-                    try:
-                        raw_industry = driver.find_element(By.CSS_SELECTOR, "ul[class='industry-link-list']")
-                        industries = raw_industry.find_elements(By.CSS_SELECTOR, "a[class='mint-link']")
-                        industry_list = []
-                        for ind_element in industries:
-                            industry_list.append(ind_element.text)
-                        industry = ", \n".join(industry_list)
-                    except NoSuchElementException:
-                        industry = "No industry given"
-
-                    # find Apprenticeships and traineeships
-                    try:
-                        raw_aat = driver.find_element(By.CSS_SELECTOR, "ul.list-inline")
-                        li_aat = raw_aat.find_elements(By.CSS_SELECTOR, "span.mint-pill__content-label")
-                        aat_list = [element.text for element in li_aat if element.text.strip() != '']
-                        aat = ", \n".join(aat_list) if aat_list else "No Apprenticeships and traineeships given"
-                    except NoSuchElementException:
-                        aat = "No Apprenticeships and traineeships given"
-
-                    # find interests
-                    try:
-                        interests = driver.find_element(By.CSS_SELECTOR, "h3[identifier='Interests_Stories_Heading'] ~ ul")
-                        overview_interests = interests.find_elements(By.CSS_SELECTOR,
-                                                                     "span[class='mint-pill__content-label']")
-                        interests_list = []
-                        for interest in overview_interests:
-                            interests_list.append(interest.text)
-                        overview_interests_text = ", \n".join(interests_list)
-                    except NoSuchElementException:
-                        overview_interests_text = "No interests given"
-
-                    # find considerations
-                    try:
-                        considerations = driver.find_element(By.CSS_SELECTOR,
-                                                             "h3[identifier='Considerations_Stories_Heading'] ~ ul")
-                        overview_considerations = considerations.find_elements(By.CSS_SELECTOR,
-                                                                               "span[class='mint-pill__content-label']")
-                        considerations_list = []
-                        for consideration in overview_considerations:
-                            considerations_list.append(consideration.text)
-                        overview_considerations_text = ", \n".join(considerations_list)
-                    except NoSuchElementException:
-                        overview_considerations_text = "No considerations given"
-
-                    # find day-to-day overview
-                    try:
-                        dtds = driver.find_element(By.CSS_SELECTOR, "h3[identifier='Day_to_day_Stories_Heading'] ~ ul")
-                        dtd_elements = dtds.find_elements(By.TAG_NAME, "li")
-                        dtd_list = []
-                        for dtd_element in dtd_elements:
-                            dtd_list.append(f"'{dtd_element.text}'")
-                        dtd = ",\n".join(dtd_list)
-                    except NoSuchElementException:
-                        dtd = "No day-to-day given"
-
-                    # find skills using skills tab
-                    try:
-                        current_url = driver.current_url
-                        skills_url = overview_to_skills(current_url)
-                        driver.get(skills_url)
-                        wait_for_page_load(driver)
                         try:
-                            skills = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR,
-                                                                                                     "p[identifier='Skills_Top_Skills_Requested'] ~ ul")))
-                            skills_elements = skills.find_elements(By.CSS_SELECTOR,
-                                                                   "span[class='mint-pill__content-label']")
-                            skills_list = []
-                            for skills_element in skills_elements:
-                                skills_list.append(skills_element.get_attribute("textContent"))
-                            skills_text = ", ".join(skills_list)
+                            wait_until_ready(driver, "occupation_detail", elements=False)
                         except TimeoutException:
-                            print("Skills section did not load in time.")
-                            skills_text = "No skills given"
-                        except Exception:
-                            skills_text = "No skills given"
-                    except (NoSuchElementException, TimeoutException) as e:
-                        print(f"Error loading skills tab: {e}")
-                        skills_text = "Failed to load skills page"
-
-                updates = [(col_description, description),
-                                     (col_average_salary, average_salary),
-                                     (col_future_demand, future_demand),
-                                     (col_job_type, job_type),
-                                     (col_skill_level, skill_level),
-                                     (col_industry, industry),
-                                     (col_skills, skills_text),
-                                     (col_aat, aat),
-                                     (col_overview_interests, overview_interests_text),
-                                     (col_overview_considerations, overview_considerations_text),
-                                     (col_overview_dtd, dtd)]
-                pending_updates.append((row_num, updates))
-                time.sleep(3)
+                            print(f"Detail page did not settle, reading what loaded: {url}")
+
+                        if PARSE_MODE == "offline":
+                            # parsed on another core while the driver moves on to the next occupation
+                            fields = parse_later(driver.page_source, OCCUPATION_DETAIL_SPEC, url)
+                        else:
+                            # every field comes back from one in-page evaluation of the spec
+                            fields = extract_fields(driver, OCCUPATION_DETAIL_SPEC)
+                        fetcher.remember(url, "occupation_detail", OCCUPATION_DETAIL_SPEC, fields)
+                        detail_url = driver.current_url
+                    skills = scrape_skills(detail_url)
+
+                pending_updates.append((row_num, (fields, skills)))
                 progress["RowNum"] += 5
                 if len(pending_updates) >= 20:
-                    batch_update_multiple_rows(occ_sheet, pending_updates)
+                    web_sheet.submit(write_details, pending_updates)
                     pending_updates = []
 
             if pending_updates:
-                batch_update_multiple_rows(occ_sheet, pending_updates)
+                web_sheet.submit(write_details, pending_updates)
                 pending_updates = []
+            web_sheet.flush()
             progress["progress"] = "finished"
             ph.save_progress(progress)
         except NoSuchElementException as e:
@@ -1,42 +1,32 @@
 # occupation_scrapping.py
-import time
+import re
 
-import gspread
-from gspread_formatting import *
-from requests import ReadTimeout
 from selenium.common.exceptions import NoSuchElementException, TimeoutException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
 
 from google_form_package import Sheet
+from keyed_upsert import STORAGE_MODE, KeyedUpsert
+from listing_cards import MISSING, OCCUPATION_CARD_FIELDS, extract_listing
+from output_sink import open_sink
+from page_readiness import polite_get, wait_until_ready
+from pagination_planner import plan_pages
+from partition_planner import CRAWL_STATES, occupation_search_url
 from process_handler import ProcessHandler
+from records import Occupation
+from write_spool import WriteSpool
 
 web_sheet = Sheet()
+sink = open_sink(web_sheet)
 driver = web_sheet.set_driver()
 
-def append_rows_with_retry(worksheet, data, retries=3, delay=5):
-    for attempt in range(retries):
-        try:
-            worksheet.append_rows(data, value_input_option="USER_ENTERED")
-            return
-        except gspread.exceptions.APIError as e:
-            if any(code in str(e) for code in ["500", "502", "503", "504", "429"]):
-                print(f"Error occurred. Retry after {delay} seconds ({attempt+1}/{retries})")
-                time.sleep(delay)
-                delay *= 2
-            else:
-                print(f"Failed to append rows {data} after {retries} attempts.")
-                return
 def set_occ_sheet():
+    sink.reset("Occupation", Occupation.HEADERS)
+    if sink.name != "sheets":
+        # formatting only applies to the live worksheet
+        return
+    # gspread_formatting is only needed for this one-off header styling
+    from gspread_formatting import CellFormat, Color, TextFormat, format_cell_range, set_column_width
+
     worksheet = web_sheet.get_worksheet("Occupation")
-    worksheet.clear()
-    headers = ["occupation code", "occupation", "occupation link", "description", "average salary", "future demand",
-               "job type",
-               "skill level", "industry", "skills", "number of vacancies",
-               "link to vacancies", "link to courses", "apprenticeships and traineeships",
-               "overview : interests", "overview : considerations", "overview : day-to-day"]
-    worksheet.append_row(headers)
     header_format = CellFormat(backgroundColor=Color(0.8, 1, 0.8), textFormat=TextFormat(bold=True, fontSize=12),
                                horizontalAlignment='CENTER')
     format_cell_range(worksheet, 'A1:Q1', header_format)
@@ -46,15 +36,10 @@ def set_occ_sheet():
         set_column_width(worksheet, col, 200)
     for col in ['P']:
         set_column_width(worksheet, col, 300)
-    return worksheet
 
 def set_occupation_data_sheet():
     # set for OccupationData sheet
-    worksheet = web_sheet.get_worksheet("OccupationData")
-    worksheet.clear()
-    headers = ["occupation code"]
-    worksheet.append_row(headers)
-    return worksheet
+    sink.reset("OccupationData", ["occupation code"])
 
 def find_occupation_code(link):
     # find occupation code from url
@@ -62,175 +47,137 @@ def find_occupation_code(link):
     found = re.findall(code, link)
     return found
 
-def wait_for_page_load(driver, timeout=15):
-    try:
-        WebDriverWait(driver, timeout).until(
-            lambda d: d.execute_script("return document.readyState") == "complete"
-        )
-    except TimeoutException:
-        print("Page loading timeout.")
-    except Exception as e:
-        print(f"An error occurred while waiting for page load: {e}")
-
 def load_to_seen_data():
-    occ_sheet = web_sheet.get_worksheet("Occupation")
-    occ_header = occ_sheet.row_values(1)
     try:
-        occ_code_idx = occ_header.index("occupation code") + 1
+        occ_codes = sink.read_columns("Occupation", ["occupation code"])[0]
     except ValueError as e:
         print("Could not detect requested row", e)
         return
-    all_rows = occ_sheet.get_all_values()[1:]
-    dup_list = []
-    for row_num, row in enumerate(all_rows, start=2):
-        occ_code = row[occ_code_idx - 1] if len(row) >= occ_code_idx else ""
-        dup_list.append([occ_code])
-    data_sheet = web_sheet.get_worksheet("OccupationData")
+    dup_list = [[occ_code] for occ_code in occ_codes]
     if dup_list:
-        data_sheet.append_rows(dup_list, value_input_option="USER_ENTERED")
+        sink.append_rows("OccupationData", dup_list)
 
-def save_seen_jobs_data(worksheet, seen_jobs):
+def save_seen_jobs_data(seen_jobs):
     rows = [[occupation_code] for occupation_code in seen_jobs]
-    worksheet.append_rows(rows, value_input_option="USER_ENTERED")
+    sink.append_rows("OccupationData", rows)
 
-def load_seen_jobs_data(worksheet):
+def load_seen_jobs_data():
     seen_jobs = set()
-    rows = worksheet.get_all_values()
-    for row in rows[1:]:
+    for row in sink.get_all_values("OccupationData")[1:]:
         if row and len(row) >= 1:
             seen_jobs.add(row[0].strip().lower())
     return seen_jobs
 
 def main():
-    wait = WebDriverWait(driver, 10)
     occ_sheet = web_sheet.get_worksheet("Occupation")
-    data_sheet = web_sheet.get_worksheet("OccupationData")
     progress_sheet = web_sheet.get_worksheet("Progress")
     load_to_seen_data()
-    seen_jobs = load_seen_jobs_data(data_sheet)
-    ph = ProcessHandler(progress_sheet, {"progress":"setting", "UrlNum":1}, "A1", shutdown_callback=lambda: save_seen_jobs_data(data_sheet, seen_jobs))
+    seen_jobs = load_seen_jobs_data()
+    ph = ProcessHandler(progress_sheet, {"progress":"setting", "UrlNum":1}, "A1", shutdown_callback=lambda: save_seen_jobs_data(seen_jobs))
     progress = ph.load_progress()
+    # scraped rows are spooled to disk and appended by a writer thread
+    spool = WriteSpool(sink, "Occupation", "occupation_scrapping")
     if progress["progress"] == "setting":
-        set_occ_sheet()
-        set_occupation_data_sheet()
+        spool.discard()
+        if STORAGE_MODE == "rewrite":
+            set_occ_sheet()
+            set_occupation_data_sheet()
+    spool.start()
     occ_sheet.update([["Running Scrapping"]], "R1")
+    # upsert keeps the sheet readable during the run, occupations no longer listed are left as they are
+    upsert = KeyedUpsert(sink, "Occupation", Occupation, "occupation_code",
+                         placeholder="No code found") if STORAGE_MODE == "upsert" else None
+    pages = None
     while not progress["progress"] == "finished":
         try:
             progress["progress"] = "progressing"
-            url = f"https://www.yourcareer.gov.au/occupations?address%5Blocality%5D=&address%5Bstate%5D=VIC&address%5Bpostcode%5D=&address%5Blatitude%5D=0&address%5Blongitude%5D=0&address%5BformattedLocality%5D=Victoria%20%28VIC%29&distanceFilter=25&pageNumber={progress['UrlNum']}"
-            driver.get(url)
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            wait_for_page_load(driver)
+            # occupations are listed nationally, the first crawl state only sets the vacancy counts shown
+            url = occupation_search_url(CRAWL_STATES[0], progress['UrlNum'])
+            polite_get(driver, url)
             print(f"current page: {url}")
             progress['UrlNum'] += 1
 
             try:
-                occupations = wait.until(EC.presence_of_all_elements_located(
-                    (By.CSS_SELECTOR, "section[class='mint-search-result-item no-description']")))
+                wait_until_ready(driver, "occupation_listing", elements=False)
+                occupations, has_next = extract_listing(driver, "occupation_listing", OCCUPATION_CARD_FIELDS)
             except TimeoutException:
                 print(f"Vacancy elements for page {progress['UrlNum']} did not load in time.")
                 break
             except Exception as e:
                 print(f"An error occurred while waiting for page load: {e}")
                 break
-            buffer = [] 
-            for occupation in occupations:
+            records = []
+            for card in occupations:
 
                 # find link to vacancies
-                try:
-                    vacancy_link = occupation.find_element(By.CSS_SELECTOR, "a[rel='nofollow']")
-                    vacancy_url = vacancy_link.get_attribute("href")
-                    vacancy_url_escaped = vacancy_url.replace('"', '\\"')
-                    vacancy_hyper_link = f'=HYPERLINK("{vacancy_url_escaped}", "{vacancy_url_escaped}")'
-                except NoSuchElementException:
+                if card["vacancy_url"] is MISSING:
                     vacancy_hyper_link = "No link given"
+                else:
+                    vacancy_url_escaped = card["vacancy_url"].replace('"', '\\"')
+                    vacancy_hyper_link = f'=HYPERLINK("{vacancy_url_escaped}", "{vacancy_url_escaped}")'
 
-                try:
-                    raw_num_vacancy = occupation.find_element(By.CSS_SELECTOR, "a[target='_blank']").text
-                    match = re.search(r"^\d+", raw_num_vacancy)
-                    if match:
-                        num_vacancy = match.group()
-                    else:
-                        num_vacancy = "No number of vacancy given"
-                except NoSuchElementException:
+                match = re.search(r"^\d+", card["vacancy_count"]) if card["vacancy_count"] is not MISSING else None
+                if match:
+                    num_vacancy = match.group()
+                else:
                     num_vacancy = "No number of vacancy given"
 
                 # find link to courses
-                courses_links = occupation.find_elements(By.CSS_SELECTOR,
-                                                         "a[aria-label^='Explore courses'], a[aria-label^='View course']")
-                if courses_links:
-                    courses_url = courses_links[0].get_attribute("href")
-                    courses_url_escaped = courses_url.replace('"', '\\"')
-                else:
+                if card["courses_url"] is MISSING:
                     courses_url_escaped = "No link given"
+                else:
+                    courses_url_escaped = card["courses_url"].replace('"', '\\"')
 
-                # move to detailed page
-                try:
-                    detail_link = occupation.find_element(By.CSS_SELECTOR, "a[class='link mint-link link']")
-
-                    # find occupation name
-                    occupation_name = detail_link.text
-
-                    # find detail page url
-                    detail_url = detail_link.get_attribute("href")
-
-                    occupation_link = detail_url
-                    occupation_hyper_link = f'=HYPERLINK("{occupation_link}", "{occupation_link}")'
-
-                except NoSuchElementException:
+                # detail page link and occupation name
+                if card["detail_url"] is MISSING:
                     occupation_name = "No occupation name given"
                     detail_url = None
                     occupation_hyper_link = "No detail url given"
+                else:
+                    occupation_name = card["occupation_name"]
+                    detail_url = card["detail_url"]
+                    occupation_hyper_link = f'=HYPERLINK("{detail_url}", "{detail_url}")'
 
                 codes = find_occupation_code(detail_url)
                 occupation_code = codes[0] if codes else "No code found"
 
                 courses_hyper_link = f'=HYPERLINK("{courses_url_escaped}", "{courses_url_escaped}")'
 
-                occupation_data = [
-                    occupation_code,
-                    occupation_name,
-                    occupation_hyper_link,
-                    "", # description
-                    "", # average salary
-                    "", # future demand
-                    "", # job type
-                    "", # skill level
-                    "", # industry
-                    "", # skills
-                    num_vacancy,
-                    vacancy_hyper_link,
-                    courses_hyper_link,
-                    "", # apprenticeships and traineeships
-                    "", # overview : interests
-                    "", # overview : considerations
-                    "" # overview : day-to-day
-                ]
-                buffer.append(occupation_data)
+                occupation_record = Occupation(occupation_code=occupation_code,
+                                               occupation=occupation_name,
+                                               occupation_link=occupation_hyper_link,
+                                               number_of_vacancies=num_vacancy,
+                                               link_to_vacancies=vacancy_hyper_link,
+                                               link_to_courses=courses_hyper_link)
+                records.append(occupation_record)
                 seen_jobs.add(occupation_code)
-                if len(buffer) == 20:
-                    append_rows_with_retry(occ_sheet, buffer, retries=3, delay=5)
-                    buffer = []
-                time.sleep(1)
-            if buffer:
-                append_rows_with_retry(occ_sheet, buffer, retries=3, delay=5)
-            try:
-                driver.find_element(By.CSS_SELECTOR, "button[aria-label='Go to next page']")
-            except NoSuchElementException:
+            rows = [record.to_row() for record in records]
+            updates = []
+            if upsert:
+                rows, updates = upsert.split(records)
+            if rows:
+                spool.append(rows)
+            if updates:
+                web_sheet.submit(sink.update_cells, "Occupation", updates)
+            if pages is None:
+                pages = plan_pages(driver, "occupation_listing", len(occupations), has_next)
+            # UrlNum already points at the next page
+            if not has_next or (pages and progress['UrlNum'] > pages[-1]):
                 progress["progress"] = "finished"
+                # a failed queued write raises here, before progress is saved as finished
+                web_sheet.flush()
                 ph.save_progress(progress)
                 print("Finished scrapping")
                 break
-            except Exception as e:
-                print(f"An error occurred while finding next button: {e}")
-                break
 
         except NoSuchElementException as e:
             print(f"Error processing job: {e}")
             progress['UrlNum'] += 1
             continue
-    time.sleep(5)
-    set_occupation_data_sheet()
+    spool.close()
+    web_sheet.flush()
+    if STORAGE_MODE == "rewrite":
+        set_occupation_data_sheet()
     driver.quit()
     print("Saved every data into the Google Sheet successfully.")
 
@@ -0,0 +1,215 @@
+# output_sink.py
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import gspread
+
+from write_planner import plan_update_requests
+
+RETRY_CODES = ["429", "500", "502", "503", "504"]
+
+
+def with_retry(func, *args, retries=4, delay=5, **kwargs):
+    for attempt in range(retries):
+        try:
+            return func(*args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            if any(code in str(e) for code in RETRY_CODES) and attempt < retries - 1:
+                print(f"API Error ({e}). Retrying after {delay} seconds... (Attempt {attempt+1}/{retries})")
+                time.sleep(delay)
+                delay *= 2
+            else:
+                raise
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SheetsSink:
+    # writes straight to the Google Sheet, the original behaviour
+    name = "sheets"
+
+    def __init__(self, web_sheet):
+        self.web_sheet = web_sheet
+        self.worksheets = {}
+
+    def worksheet(self, table):
+        if table not in self.worksheets:
+            self.worksheets[table] = with_retry(self.web_sheet.get_worksheet, table)
+        return self.worksheets[table]
+
+    def reset(self, table, headers):
+        worksheet = self.worksheet(table)
+        with_retry(worksheet.clear)
+        with_retry(worksheet.append_row, headers)
+        self.web_sheet.headers.pop(worksheet.id, None)
+
+    def append_rows(self, table, rows):
+        self.worksheet(table).append_rows(rows, value_input_option="USER_ENTERED")
+
+    def update_cells(self, table, updates_list):
+        worksheet = self.worksheet(table)
+        for body in plan_update_requests(worksheet.id, updates_list):
+            with_retry(worksheet.spreadsheet.batch_update, body)
+
+    def read_cells(self, table, row_indices, col):
+        cells = with_retry(self.worksheet(table).range, min(row_indices), col, max(row_indices), col)
+        return {cell.row: cell.value or "" for cell in cells}
+
+    def get_header(self, table):
+        return with_retry(self.web_sheet.get_header, self.worksheet(table))
+
+    def get_all_values(self, table):
+        return with_retry(self.web_sheet.get_all_values_cached, self.worksheet(table))
+
+    def read_columns(self, table, header_names):
+        return with_retry(self.web_sheet.read_columns, self.worksheet(table), header_names)
+
+    def iter_rows(self, table, header_names=None):
+        return self.web_sheet.iter_rows(self.worksheet(table), header_names)
+
+
+class SQLiteSink:
+    # local working store, rows keep their sheet row numbers so the stages work unchanged
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sink_headers (name TEXT PRIMARY KEY, header TEXT)")
+        # the background writer and the scrape loop share this connection
+        self.lock = threading.Lock()
+        self.headers = {}
+
+    def reset(self, table, headers):
+        columns = ", ".join(f"{quote(header)} TEXT" for header in headers)
+        with self.lock, self.connection:
+            self.connection.execute(f"DROP TABLE IF EXISTS {quote(table)}")
+            self.connection.execute(f"CREATE TABLE {quote(table)} (row_num INTEGER PRIMARY KEY, {columns})")
+            self.connection.execute("INSERT OR REPLACE INTO sink_headers VALUES (?, ?)", (table, json.dumps(headers)))
+        self.headers[table] = headers
+
+    def get_header(self, table):
+        if table not in self.headers:
+            with self.lock:
+                row = self.connection.execute("SELECT header FROM sink_headers WHERE name = ?", (table,)).fetchone()
+            if not row:
+                return []
+            self.headers[table] = json.loads(row[0])
+        return self.headers[table]
+
+    def append_rows(self, table, rows):
+        header = self.get_header(table)
+        columns = ", ".join(["row_num"] + [quote(name) for name in header])
+        placeholders = ", ".join(["?"] * (len(header) + 1))
+        with self.lock, self.connection:
+            last_row = self.connection.execute(f"SELECT MAX(row_num) FROM {quote(table)}").fetchone()[0] or 1
+            values = []
+            for offset, row in enumerate(rows, start=1):
+                row = [str(value) for value in row[:len(header)]]
+                values.append([last_row + offset] + row + [""] * (len(header) - len(row)))
+            self.connection.executemany(f"INSERT INTO {quote(table)} ({columns}) VALUES ({placeholders})", values)
+
+    def update_cells(self, table, updates_list):
+        header = self.get_header(table)
+        with self.lock, self.connection:
+            for row_num, updates in updates_list:
+                self.connection.execute(f"INSERT OR IGNORE INTO {quote(table)} (row_num) VALUES (?)", (row_num,))
+                for col, value in updates:
+                    self.connection.execute(f"UPDATE {quote(table)} SET {quote(header[col - 1])} = ? WHERE row_num = ?",
+                                            (str(value), row_num))
+
+    def read_cells(self, table, row_indices, col):
+        column = quote(self.get_header(table)[col - 1])
+        placeholders = ", ".join(["?"] * len(row_indices))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT row_num, {column} FROM {quote(table)} WHERE row_num IN ({placeholders})", list(row_indices))
+            values = {row_num: value or "" for row_num, value in rows}
+        return {row_num: values.get(row_num, "") for row_num in row_indices}
+
+    def select_rows(self, table, header_names):
+        # rows ordered by sheet row number, gaps filled so list positions still map to rows
+        columns = ", ".join(quote(name) for name in header_names)
+        with self.lock:
+            rows = self.connection.execute(f"SELECT row_num, {columns} FROM {quote(table)} ORDER BY row_num").fetchall()
+        result = []
+        for row in rows:
+            while len(result) + 2 < row[0]:
+                result.append([""] * len(header_names))
+            result.append(["" if value is None else value for value in row[1:]])
+        return result
+
+    def get_all_values(self, table):
+        header = self.get_header(table)
+        if not header:
+            return []
+        return [list(header)] + self.select_rows(table, header)
+
+    def read_columns(self, table, header_names):
+        header = self.get_header(table)
+        for name in header_names:
+            header.index(name)
+        rows = self.select_rows(table, header_names)
+        return [[row[i] for row in rows] for i in range(len(header_names))]
+
+    def iter_rows(self, table, header_names=None, window=2000):
+        # same (row_num, values) stream as Sheet.iter_rows, read with fetchmany so memory stays bounded
+        names = header_names or self.get_header(table)
+        columns = ", ".join(quote(name) for name in names)
+        with self.lock:
+            cursor = self.connection.execute(f"SELECT row_num, {columns} FROM {quote(table)} ORDER BY row_num")
+            rows = cursor.fetchmany(window)
+        expected = 2
+        while rows:
+            for row in rows:
+                while expected < row[0]:
+                    yield expected, [""] * len(names)
+                    expected += 1
+                yield row[0], ["" if value is None else value for value in row[1:]]
+                expected = row[0] + 1
+            with self.lock:
+                rows = cursor.fetchmany(window)
+
+    def export_csv(self, table, path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(self.get_all_values(table))
+
+    def export_parquet(self, table, path):
+        # pyarrow is only needed for this export
+        import pyarrow
+        import pyarrow.parquet
+
+        header = self.get_header(table)
+        rows = self.select_rows(table, header)
+        columns = {name: [row[i] for row in rows] for i, name in enumerate(header)}
+        pyarrow.parquet.write_table(pyarrow.table(columns), path)
+
+    def publish(self, web_sheet, table, chunk_rows=5000):
+        # one bulk upload replaces the worksheet contents
+        values = self.get_all_values(table)
+        worksheet = web_sheet.get_worksheet(table)
+        with_retry(worksheet.clear)
+        if worksheet.row_count < len(values):
+            with_retry(worksheet.add_rows, len(values) - worksheet.row_count)
+        for start in range(0, len(values), chunk_rows):
+            with_retry(worksheet.update, values[start:start + chunk_rows], f"A{start + 1}",
+                       value_input_option="USER_ENTERED")
+        print(f"Published {len(values) - 1} rows to {table}")
+
+
+def open_sink(web_sheet):
+    # only scraped rows go through the sink, the Progress sheet and the status cells stay in Google Sheets,
+    # so every OUTPUT_SINK still needs SERVICE_ACCOUNT_KEY
+    kind = os.environ.get("OUTPUT_SINK", "sheets")
+    if kind == "sheets":
+        return SheetsSink(web_sheet)
+    if kind == "sqlite":
+        return SQLiteSink(os.environ.get("OUTPUT_PATH", "yourcareer.sqlite3"))
+    raise ValueError(f"Unknown OUTPUT_SINK: {kind}")
@@ -0,0 +1,105 @@
+# page_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import zstandard
+
+# PAGE_CACHE_PATH turns the cache on, keep the file between runs for it to pay off
+PAGE_CACHE_PATH = os.environ.get("PAGE_CACHE_PATH")
+
+# seconds a page is trusted without asking the server again, PAGE_CACHE_TTLS="kind=seconds,kind=seconds"
+DEFAULT_TTLS = {"occupation_detail": 7 * 86400, "occupation_skills": 7 * 86400, "vacancy_detail": 86400}
+
+
+def parse_ttls(value):
+    ttls = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        kind, _, seconds = item.partition("=")
+        ttls[kind.strip()] = float(seconds)
+    return ttls
+
+
+def digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def spec_key(spec):
+    # cached fields are only reused by the spec that produced them
+    return digest(json.dumps(spec, sort_keys=True))[:16]
+
+
+class PageCache:
+    def __init__(self, path, ttls=None):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls if ttls is not None else parse_ttls(os.environ.get("PAGE_CACHE_TTLS", "")))
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, kind TEXT, checked_at REAL, "
+                                "etag TEXT, last_modified TEXT, digest TEXT, body BLOB, spec TEXT, fields TEXT)")
+        # zstd contexts are not thread safe, they share the connection's lock
+        self.lock = threading.Lock()
+        self.compressor = zstandard.ZstdCompressor(level=10)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def lookup(self, url):
+        with self.lock:
+            row = self.connection.execute("SELECT kind, checked_at, etag, last_modified, digest, spec, fields "
+                                          "FROM pages WHERE url = ?", (url,)).fetchone()
+        if not row:
+            return None
+        kind, checked_at, etag, last_modified, page_digest, spec, fields = row
+        return {"url": url, "kind": kind, "checked_at": checked_at, "etag": etag, "last_modified": last_modified,
+                "digest": page_digest, "spec": spec, "fields": json.loads(fields) if fields else None}
+
+    def text(self, entry):
+        with self.lock:
+            row = self.connection.execute("SELECT body FROM pages WHERE url = ?", (entry["url"],)).fetchone()
+            if not row or row[0] is None:
+                return ""
+            return self.decompressor.decompress(row[0]).decode("utf-8")
+
+    def is_fresh(self, entry):
+        return time.time() - entry["checked_at"] < self.ttls.get(entry["kind"], 0)
+
+    @staticmethod
+    def validators(entry):
+        # conditional request headers, the server answers 304 when the page is unchanged
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store_page(self, url, kind, page):
+        # a changed page, its old fields no longer apply
+        headers = page.headers or {}
+        with self.lock, self.connection:
+            body = self.compressor.compress(page.text.encode("utf-8"))
+            self.connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, NULL, NULL)",
+                                    (url, kind, time.time(), headers.get("ETag"), headers.get("Last-Modified"),
+                                     digest(page.text), body))
+
+    def touch(self, url, page=None):
+        # revalidated unchanged, trusted for another TTL
+        headers = page.headers if page is not None and page.headers else {}
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE pages SET checked_at = ?, etag = COALESCE(?, etag), "
+                                    "last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                                    (time.time(), headers.get("ETag"), headers.get("Last-Modified"), url))
+
+    def store_fields(self, url, kind, spec, fields):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO pages (url, kind, checked_at) VALUES (?, ?, ?)",
+                                    (url, kind, time.time()))
+            self.connection.execute("UPDATE pages SET spec = ?, fields = ? WHERE url = ?",
+                                    (spec, json.dumps(fields), url))
+
+
+def open_page_cache(path=PAGE_CACHE_PATH):
+    return PageCache(path) if path else None
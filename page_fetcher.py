@@ -0,0 +1,160 @@
+# page_fetcher.py
+import os
+from concurrent.futures import Future
+from urllib.parse import urlparse
+
+import lxml.html
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from page_cache import digest, spec_key
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36"
+
+# auto: plain HTTP first, Chrome when the page needs JavaScript; http / browser force one backend
+FETCH_MODE = os.environ.get("FETCH_MODE", "auto")
+# kinds whose fields are read from the server's HTML, a 304 on a client-rendered shell says nothing about them
+HTTP_BODY_KINDS = {"occupation_skills"}
+
+
+class Page:
+    def __init__(self, url, status, text, via, headers=None):
+        self.url = url
+        self.status = status
+        self.text = text
+        self.via = via
+        self.headers = headers
+        self._tree = None
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = lxml.html.fromstring(self.text or "<html></html>")
+        return self._tree
+
+    def select(self, selector):
+        return self.tree.cssselect(selector)
+
+    def has(self, selector):
+        return bool(self.select(selector))
+
+
+class HttpFetcher:
+    def __init__(self, pool_size=8, timeout=20):
+        # one keep-alive pool per process, retried on throttling and server errors
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        retry = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, url, headers=None):
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        return Page(response.url, response.status_code, response.text, "http", response.headers)
+
+
+class BrowserFetcher:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def fetch(self, url, ready_selector=None, timeout=10):
+        # selenium is only needed once a page falls back to the browser
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        from page_readiness import polite_get
+
+        # the fallback shares the per-host delay with the crawl's own browser requests
+        polite_get(self.driver, url)
+        if ready_selector:
+            try:
+                WebDriverWait(self.driver, timeout).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, ready_selector)))
+            except TimeoutException:
+                print(f"{ready_selector} did not load in time: {url}")
+        return Page(self.driver.current_url, 200, self.driver.page_source, "browser")
+
+
+class PageFetcher:
+    def __init__(self, driver=None, http=None, mode=FETCH_MODE, cache=None):
+        self.http = http or HttpFetcher()
+        self.browser = BrowserFetcher(driver) if driver else None
+        self.mode = mode
+        self.cache = cache
+        # (host, selector) pairs whose HTTP response lacked the content, they go straight to Chrome
+        self.browser_only = set()
+
+    def fetch(self, url, ready_selector=None):
+        key = (urlparse(url).netloc, ready_selector)
+        if self.mode != "browser" and key not in self.browser_only:
+            try:
+                page = self.http_fetch(url)
+                if page.status == 200 and (not ready_selector or page.has(ready_selector)):
+                    return page
+            except requests.RequestException as e:
+                print(f"HTTP fetch failed ({e}): {url}")
+            if self.browser and self.mode == "auto":
+                # rendered client side, remember so later pages skip the wasted request
+                print(f"{url} needs a browser, switching to Chrome for these pages")
+                self.browser_only.add(key)
+        if not self.browser or self.mode == "http":
+            return Page(url, 0, "", "none")
+        return self.browser.fetch(url, ready_selector)
+
+    def http_fetch(self, url):
+        # a page revalidated or stored by cached_fields comes back from the cache on a 304
+        entry = self.cache.lookup(url) if self.cache else None
+        page = self.http.fetch(url, self.cache.validators(entry) if entry else None)
+        if page.status == 304 and entry:
+            return Page(url, 200, self.cache.text(entry), "cache", page.headers)
+        return page
+
+    def cached_fields(self, url, kind, spec):
+        # fields extracted from this page last time, None when it has to be loaded and extracted again
+        if not self.cache:
+            return None
+        entry = self.cache.lookup(url)
+        fields = entry["fields"] if entry and entry["spec"] == spec_key(spec) else None
+        if fields is None:
+            return None
+        if self.cache.is_fresh(entry):
+            return fields
+        if kind not in HTTP_BODY_KINDS:
+            return None
+        # only a conditional request, a page without validators is not downloaded twice to compare it
+        validators = self.cache.validators(entry)
+        if not validators:
+            return None
+        try:
+            page = self.http.fetch(url, validators)
+        except requests.RequestException as e:
+            print(f"Cache revalidation failed ({e}): {url}")
+            return None
+        if page.status == 304 or (page.status == 200 and digest(page.text) == entry["digest"]):
+            self.cache.touch(url, page)
+            return fields
+        if page.status == 200:
+            # changed, a later http_fetch of this url is answered from the stored body
+            self.cache.store_page(url, kind, page)
+        return None
+
+    def remember(self, url, kind, spec, fields, page=None, **extra):
+        # fields may still be parsing offline, they are stored once the parse finishes
+        if not self.cache:
+            return
+        if page is not None and kind in HTTP_BODY_KINDS:
+            # the validators come from the response the fields were read from, no extra request
+            if page.via == "http" and page.status == 200:
+                self.cache.store_page(url, kind, page)
+            elif page.via == "cache":
+                self.cache.touch(url, page)
+        if isinstance(fields, Future):
+            fields.add_done_callback(
+                lambda done: done.exception() is None and self.remember(url, kind, spec, done.result(), **extra))
+            return
+        self.cache.store_fields(url, kind, spec_key(spec), dict(fields, **extra))
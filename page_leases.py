@@ -0,0 +1,137 @@
+# page_leases.py
+import heapq
+import os
+import threading
+import time
+
+# a page not finished within this many seconds is handed to the next idle worker as well
+LEASE_SECONDS = float(os.environ.get("PAGE_LEASE_SECONDS", 180))
+
+
+class PageLeases:
+    def __init__(self, first_page=1, lease_seconds=LEASE_SECONDS, max_attempts=3, max_failed_run=3):
+        self.first_page = first_page
+        self.next_page = first_page
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # this many failed pages in a row with nothing read past them is taken as the end of the listing
+        self.max_failed_run = max_failed_run
+        # three bounds on the listing: a page that reported no next page, the page count planned from the
+        # result count, and a run of failed pages; only the first is certain, the others can be undone
+        self.end_page = None
+        self.planned_page = None
+        self.failed_end = None
+        self.planned = False
+        self.leases = {}
+        self.retry = []
+        self.attempts = {}
+        # every page below the watermark is done, the ones above it are kept in done
+        self.watermark = first_page
+        self.done = set()
+        self.highest_completed = 0
+        # pages given up on, the listing was not read in full
+        self.failed = set()
+        self.condition = threading.Condition()
+
+    @property
+    def last_page(self):
+        bounds = [bound for bound in (self.end_page, self.planned_page, self.failed_end) if bound is not None]
+        return min(bounds) if bounds else None
+
+    def beyond_end(self, page):
+        return self.last_page is not None and page > self.last_page
+
+    def claim(self):
+        # next page to crawl, None once every page up to the last one is done
+        with self.condition:
+            while True:
+                page = self._next_page()
+                if page is not None:
+                    self.leases[page] = time.monotonic() + self.lease_seconds
+                    self.attempts[page] = self.attempts.get(page, 0) + 1
+                    return page
+                if not self.leases:
+                    return None
+                # everything left is leased, wait for a result or for the oldest lease to run out
+                self.condition.wait(max(0.1, min(self.leases.values()) - time.monotonic()))
+
+    def _next_page(self):
+        while self.retry:
+            page = heapq.heappop(self.retry)
+            if not self.beyond_end(page) and not self.is_done(page):
+                return page
+        now = time.monotonic()
+        for page, expires in sorted(self.leases.items()):
+            if expires > now:
+                continue
+            if self.beyond_end(page):
+                del self.leases[page]
+                continue
+            # a straggler, whichever worker finishes the page first keeps its rows
+            print(f"Lease on page {page} expired, handing it to another worker")
+            return page
+        if self.beyond_end(self.next_page):
+            return None
+        self.next_page += 1
+        return self.next_page - 1
+
+    def is_done(self, page):
+        return page < self.watermark or page in self.done
+
+    def complete(self, page, has_next):
+        # False when another worker already finished this page, its rows are then dropped
+        with self.condition:
+            self.leases.pop(page, None)
+            if self.is_done(page):
+                return False
+            self.mark_done(page)
+            self.highest_completed = max(self.highest_completed, page)
+            if not has_next:
+                self.end_page = page if self.end_page is None else min(self.end_page, page)
+            elif self.planned_page is not None and page >= self.planned_page:
+                # the plan came up short, back to probing the next button
+                self.planned_page = None
+            if self.failed_end is not None and page > self.failed_end:
+                # a page past the failed run loaded after all, the listing goes on
+                self.failed_end = None
+            self.condition.notify_all()
+            return True
+
+    def mark_done(self, page):
+        self.done.add(page)
+        while self.watermark in self.done:
+            self.done.remove(self.watermark)
+            self.watermark += 1
+
+    def plan(self, last_page):
+        # no worker claims a page past the planned last page
+        with self.condition:
+            self.planned = True
+            self.planned_page = last_page if self.planned_page is None else min(self.planned_page, last_page)
+            self.condition.notify_all()
+
+    def fail(self, page):
+        with self.condition:
+            self.leases.pop(page, None)
+            if self.is_done(page) or self.beyond_end(page):
+                pass
+            elif self.attempts[page] < self.max_attempts:
+                heapq.heappush(self.retry, page)
+            else:
+                # a page that never loads is skipped, the pages after it are still crawled
+                print(f"Giving up on page {page} after {self.attempts[page]} attempts")
+                self.failed.add(page)
+                self.mark_done(page)
+                start, end = page, page
+                while start - 1 in self.failed:
+                    start -= 1
+                while end + 1 in self.failed:
+                    end += 1
+                if end - start + 1 >= self.max_failed_run and self.highest_completed < start:
+                    print(f"Pages {start} to {end} all failed, taking page {start - 1} as the last one")
+                    self.failed_end = start - 1 if self.failed_end is None else min(self.failed_end, start - 1)
+            self.condition.notify_all()
+
+    @property
+    def finished(self):
+        return self.last_page is not None and self.watermark > self.last_page
@@ -0,0 +1,84 @@
+# page_readiness.py
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+
+# a page is ready once its container exists and the match count stops changing for stable_for seconds
+READY_CONDITIONS = {
+    "vacancy_listing": {"selector": "section.mint-search-result-item.has-img.has-actions.has-preheading",
+                        "stable_for": 0.5, "timeout": 10},
+    "occupation_listing": {"selector": "section[class='mint-search-result-item no-description']",
+                           "stable_for": 0.5, "timeout": 10},
+    "vacancy_detail": {"selector": "ul.job-info-metadata", "stable_for": 0.3, "timeout": 15},
+    "occupation_detail": {"selector": "div[class='text-lg']", "stable_for": 0.3, "timeout": 15},
+}
+
+COUNT_SCRIPT = "return document.querySelectorAll(arguments[0]).length;"
+
+# seconds between two requests to the same host, POLITENESS_DELAYS="host=seconds,host=seconds"
+DEFAULT_DELAY = float(os.environ.get("POLITENESS_DEFAULT_DELAY", 1))
+
+
+def wait_until_ready(driver, page, poll=0.1, elements=True):
+    # returns the matching elements (or just their count), raises TimeoutException if they never appear or settle
+    condition = READY_CONDITIONS[page]
+    deadline = time.monotonic() + condition["timeout"]
+    last_count = 0
+    stable_since = None
+    while time.monotonic() < deadline:
+        count = driver.execute_script(COUNT_SCRIPT, condition["selector"])
+        now = time.monotonic()
+        if count and count == last_count:
+            if now - stable_since >= condition["stable_for"]:
+                if not elements:
+                    return count
+                return driver.find_elements(By.CSS_SELECTOR, condition["selector"])
+        else:
+            stable_since = now
+            last_count = count
+        time.sleep(poll)
+    raise TimeoutException(f"{page} not ready: {condition['selector']}")
+
+
+def parse_delays(value):
+    delays = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        host, _, seconds = item.partition("=")
+        delays[host.strip()] = float(seconds)
+    return delays
+
+
+class Politeness:
+    def __init__(self, delays=None, default_delay=DEFAULT_DELAY):
+        self.delays = delays if delays is not None else parse_delays(os.environ.get("POLITENESS_DELAYS", ""))
+        self.default_delay = default_delay
+        self.last_request = {}
+        self.lock = threading.Lock()
+
+    def delay_for(self, host):
+        for suffix, delay in self.delays.items():
+            if host == suffix or host.endswith("." + suffix):
+                return delay
+        return self.default_delay
+
+    def wait(self, url):
+        # only sleeps for whatever is left of the host's interval, fast pages pay nothing extra
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            ready_at = max(now, self.last_request.get(host, 0) + self.delay_for(host))
+            self.last_request[host] = ready_at
+        if ready_at > now:
+            time.sleep(ready_at - now)
+
+
+politeness = Politeness()
+
+
+def polite_get(driver, url):
+    politeness.wait(url)
+    driver.get(url)
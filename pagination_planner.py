@@ -0,0 +1,50 @@
+# pagination_planner.py
+import math
+import os
+
+from page_readiness import READY_CONDITIONS
+
+# the result summary above the cards, e.g. "1,234 jobs found"; card text such as "12 jobs" is skipped
+RESULT_COUNT_PATTERN = r"([\d,]+)\s+(?:jobs?|results?|occupations?|vacancies)\b"
+# only the results summary, a heading that happens to mention "N jobs" is not a result count
+SUMMARY_SELECTOR = os.environ.get("RESULT_SUMMARY_SELECTOR",
+                                  "[class*='results-count'], [class*='result-count'], [class*='results-summary'], "
+                                  "[role='status'], [aria-live]")
+
+# the summary sits above the first card and is a short line of text, not a container of the listing
+RESULT_COUNT_SCRIPT = """
+const [summarySelector, cardSelector, pattern] = arguments;
+const regex = new RegExp(pattern, 'i');
+const firstCard = document.querySelector(cardSelector);
+for (const element of document.querySelectorAll(summarySelector)) {
+    if (element.closest(cardSelector) || element.querySelector(cardSelector)) continue;
+    if (firstCard && !(element.compareDocumentPosition(firstCard) & Node.DOCUMENT_POSITION_FOLLOWING)) continue;
+    const text = element.innerText || '';
+    if (text.length > 200) continue;
+    const match = text.match(regex);
+    if (match) return match[1];
+}
+return null;
+"""
+
+
+def read_result_count(driver, page):
+    value = driver.execute_script(RESULT_COUNT_SCRIPT, SUMMARY_SELECTOR, READY_CONDITIONS[page]["selector"],
+                                  RESULT_COUNT_PATTERN)
+    return int(value.replace(",", "")) if value else None
+
+
+def plan_pages(driver, page, page_size, has_next):
+    # every page number of the listing, read from a full page; None leaves the caller probing the next button
+    if not has_next or not page_size:
+        return None
+    total = read_result_count(driver, page)
+    if not total:
+        return None
+    if total <= page_size:
+        # a full page with a next button has more results than fit on it, this count is not the total
+        print(f"Ignoring result count {total}, the listing has more than {page_size} results")
+        return None
+    pages = range(1, math.ceil(total / page_size) + 1)
+    print(f"{total} results at {page_size} per page, {len(pages)} pages planned")
+    return pages
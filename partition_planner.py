@@ -0,0 +1,167 @@
+# partition_planner.py
+import os
+from urllib.parse import parse_qsl, quote, urlencode, urlparse
+
+from selenium.common.exceptions import TimeoutException
+
+from keyed_upsert import plain
+from listing_cards import VACANCY_CARD_FIELDS, extract_listing
+from page_readiness import polite_get, wait_until_ready
+from pagination_planner import plan_pages
+
+VACANCY_SEARCH_URL = "https://www.workforceaustralia.gov.au/individuals/jobs/search"
+OCCUPATION_SEARCH_URL = "https://www.yourcareer.gov.au/occupations"
+
+# workforceaustralia locationCodes per state, more with STATE_LOCATION_CODES="NSW=<code>,QLD=<code>"
+STATE_LOCATION_CODES = {"VIC": 7}
+STATE_NAMES = {"ACT": "Australian Capital Territory", "NSW": "New South Wales", "NT": "Northern Territory",
+               "QLD": "Queensland", "SA": "South Australia", "TAS": "Tasmania", "VIC": "Victoria",
+               "WA": "Western Australia"}
+
+CRAWL_STATES = [state.strip().upper() for state in os.environ.get("CRAWL_STATES", "VIC").split(",") if state.strip()]
+CRAWL_JOB_AGES = [age.strip() for age in os.environ.get("CRAWL_JOB_AGES", "3").split(",") if age.strip()]
+# a partition over this many pages is split by occupation, then into page ranges
+PAGE_BUDGET = int(os.environ.get("PARTITION_PAGE_BUDGET", 50))
+# query keys of the occupation vacancy links that are not part of the occupation filter
+NON_FILTER_KEYS = {"locationCodes[0]", "jobAge", "pageNumber"}
+
+
+def parse_location_codes(value):
+    codes = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        state, _, code = item.partition("=")
+        codes[state.strip().upper()] = int(code)
+    return codes
+
+
+STATE_LOCATION_CODES.update(parse_location_codes(os.environ.get("STATE_LOCATION_CODES", "")))
+
+
+def with_query(url, params):
+    # url with params added to (or replacing) its query string
+    parsed = urlparse(url)
+    query = dict(parse_qsl(parsed.query))
+    query.update((key, str(value)) for key, value in params.items())
+    return parsed._replace(query=urlencode(query, quote_via=quote)).geturl()
+
+
+def vacancy_search_url(state, job_age):
+    return with_query(VACANCY_SEARCH_URL, {"locationCodes[0]": STATE_LOCATION_CODES[state], "jobAge": job_age})
+
+
+def occupation_search_url(state, page):
+    return with_query(OCCUPATION_SEARCH_URL, {
+        "address[locality]": "", "address[state]": state, "address[postcode]": "",
+        "address[latitude]": 0, "address[longitude]": 0,
+        "address[formattedLocality]": f"{STATE_NAMES[state]} ({state})",
+        "distanceFilter": 25, "pageNumber": page})
+
+
+class Partition:
+    # one schedulable slice of the vacancy search, crawled page by page by a single worker
+    def __init__(self, name, url, pages=None, split=False, first_page=1, params=None):
+        self.name = name
+        self.url = url
+        # the crawl's own query params (its sort), the probe reads the same pages the crawl will
+        self.params = params or {}
+        self.pages = pages
+        # split partitions only cover vacancies that carry one of the occupation filters
+        self.split = split
+        self.first_page = first_page
+
+    def __repr__(self):
+        return f"Partition({self.name!r}, pages={self.pages})"
+
+    @property
+    def last_page(self):
+        # None when the page count is unknown, the crawl then follows the next button
+        return self.first_page + self.pages - 1 if self.pages else None
+
+    def page_url(self, page):
+        return with_query(self.url, dict(self.params, pageNumber=page))
+
+
+def probe(driver, partition):
+    # page count from the partition's first page, None when the count is not shown
+    polite_get(driver, partition.page_url(1))
+    try:
+        wait_until_ready(driver, "vacancy_listing", elements=False)
+    except TimeoutException:
+        return 0
+    cards, has_next = extract_listing(driver, "vacancy_listing", VACANCY_CARD_FIELDS)
+    if not has_next:
+        return 1 if cards else 0
+    pages = plan_pages(driver, "vacancy_listing", len(cards), has_next)
+    return len(pages) if pages else None
+
+
+def occupation_filters(sink):
+    # [(occupation code, filter params)] from the Occupation sheet's "link to vacancies", skipping empty occupations
+    try:
+        codes, counts, links = sink.read_columns("Occupation", ["occupation code", "number of vacancies",
+                                                                "link to vacancies"])
+    except ValueError as e:
+        print("Could not read occupation filters", e)
+        return []
+    filters = []
+    for code, count, link in zip(codes, counts, links):
+        count = str(count).replace(",", "")
+        if not count.isdigit() or int(count) == 0:
+            continue
+        params = {key: value for key, value in parse_qsl(urlparse(plain(link)).query) if key not in NON_FILTER_KEYS}
+        if params:
+            filters.append((code, params))
+    return filters
+
+
+def page_slices(partition, budget):
+    # a partition still over budget is cut into runs of at most budget pages
+    if not partition.pages or partition.pages <= budget:
+        return [partition]
+    slices = []
+    for first_page in range(1, partition.pages + 1, budget):
+        pages = min(budget, partition.pages - first_page + 1)
+        slices.append(Partition(f"{partition.name}/pages={first_page}-{first_page + pages - 1}", partition.url,
+                                pages, partition.split, first_page, partition.params))
+    return slices
+
+
+def split_by_occupation(driver, base, filters, budget):
+    # every child is probed, the sheet's vacancy counts are for one state and ignore the jobAge window
+    children = []
+    for code, params in filters:
+        child = Partition(f"{base.name}/occupation={code}", with_query(base.url, params), split=True,
+                          params=base.params)
+        child.pages = probe(driver, child)
+        if child.pages != 0:
+            children.extend(page_slices(child, budget))
+    return children
+
+
+def plan_partitions(driver, sink, states=None, job_ages=None, budget=PAGE_BUDGET, params=None):
+    # state x jobAge partitions, the ones over budget split by occupation or page range, largest first
+    partitions = []
+    filters = None
+    for state in states or CRAWL_STATES:
+        if state not in STATE_LOCATION_CODES:
+            print(f"No location code for {state}, add it to STATE_LOCATION_CODES")
+            continue
+        for job_age in job_ages or CRAWL_JOB_AGES:
+            base = Partition(f"{state}/jobAge={job_age}", vacancy_search_url(state, job_age), params=params)
+            base.pages = probe(driver, base)
+            if base.pages == 0:
+                continue
+            if base.pages is None or base.pages <= budget:
+                partitions.append(base)
+                continue
+            if filters is None:
+                filters = occupation_filters(sink)
+            children = split_by_occupation(driver, base, filters, budget)
+            if not children:
+                children = page_slices(base, budget)
+            print(f"{base.name}: {base.pages} pages is over the budget of {budget}, "
+                  f"split into {len(children)} partitions")
+            partitions.extend(children)
+    # the longest partitions start first, the short ones fill in around them
+    partitions.sort(key=lambda partition: partition.pages or 0, reverse=True)
+    return partitions
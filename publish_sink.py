@@ -0,0 +1,28 @@
+# publish_sink.py
+import os
+import sys
+
+from google_form_package import Sheet
+from output_sink import SQLiteSink
+
+TABLES = ["Occupation", "Vacancies"]
+
+
+def main():
+    # usage: python publish_sink.py [sheets] [csv] [parquet]
+    targets = sys.argv[1:] or ["sheets"]
+    sink = SQLiteSink(os.environ.get("OUTPUT_PATH", "yourcareer.sqlite3"))
+    web_sheet = Sheet() if "sheets" in targets else None
+    for table in TABLES:
+        if "sheets" in targets:
+            sink.publish(web_sheet, table)
+        if "csv" in targets:
+            sink.export_csv(table, f"{table}.csv")
+            print(f"Exported {table}.csv")
+        if "parquet" in targets:
+            sink.export_parquet(table, f"{table}.parquet")
+            print(f"Exported {table}.parquet")
+
+
+if __name__ == "__main__":
+    main()
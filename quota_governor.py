@@ -0,0 +1,61 @@
+# quota_governor.py
+import fcntl
+import json
+import os
+import tempfile
+import time
+
+# Sheets API allows 60 read and 60 write requests per minute for one service account
+DEFAULT_LIMITS = {"read": 60, "write": 60}
+
+
+class QuotaGovernor:
+    def __init__(self, state_path=None, limits=None):
+        # every process on the host shares one bucket file, guarded by flock
+        self.state_path = state_path or os.environ.get("SHEETS_QUOTA_FILE") or os.path.join(
+            tempfile.gettempdir(), "yourcareer_sheets_quota.json")
+        self.limits = limits or {
+            "read": int(os.environ.get("SHEETS_READS_PER_MINUTE", DEFAULT_LIMITS["read"])),
+            "write": int(os.environ.get("SHEETS_WRITES_PER_MINUTE", DEFAULT_LIMITS["write"]))
+        }
+
+    def acquire(self, kind):
+        # block until a token for this kind of call is available
+        while True:
+            wait = self._take(kind)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def exhaust(self, kind):
+        # a 429 means another host spent the quota, so make everyone here wait for a refill
+        self._update(kind, lambda tokens: (0.0, 0))
+
+    def _take(self, kind):
+        def take(tokens):
+            if tokens >= 1:
+                return tokens - 1, 0
+            return tokens, (1 - tokens) * 60.0 / self.limits[kind]
+        return self._update(kind, take)
+
+    def _update(self, kind, func):
+        capacity = self.limits[kind]
+        with open(self.state_path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}
+                now = time.time()
+                bucket = state.get(kind, {"tokens": capacity, "updated": now})
+                refill = (now - bucket["updated"]) * capacity / 60.0
+                tokens, wait = func(min(capacity, bucket["tokens"] + refill))
+                state[kind] = {"tokens": tokens, "updated": now}
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return wait
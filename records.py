@@ -0,0 +1,71 @@
+# records.py
+import re
+
+
+def attribute_name(header):
+    # "overview : day-to-day" -> "overview_day_to_day"
+    return re.sub(r"\W+", "_", header).strip("_")
+
+
+class Record:
+    # HEADERS is the single schema: sheet column order and header names
+    __slots__ = ()
+    HEADERS = []
+    FIELDS = ()
+    COLUMNS = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELDS = tuple(attribute_name(header) for header in cls.HEADERS)
+        cls.COLUMNS = {field: i + 1 for i, field in enumerate(cls.FIELDS)}
+
+    def __init__(self, **values):
+        for field in self.FIELDS:
+            setattr(self, field, values.pop(field, ""))
+        if values:
+            raise TypeError(f"Unknown {type(self).__name__} fields: {', '.join(values)}")
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{f}={getattr(self, f)!r}' for f in self.FIELDS)})"
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_row() == other.to_row()
+
+    @classmethod
+    def column(cls, field):
+        # 1-based sheet column of a field, accepts the attribute or the header name
+        return cls.COLUMNS[attribute_name(field)]
+
+    @classmethod
+    def from_row(cls, row):
+        record = cls.__new__(cls)
+        for i, field in enumerate(cls.FIELDS):
+            setattr(record, field, row[i] if i < len(row) else "")
+        return record
+
+    def to_row(self):
+        return [getattr(self, field) for field in self.FIELDS]
+
+    def diff(self, other):
+        # [(column, value)] for the fields of self that differ from other, ready for sink.update_cells
+        changes = []
+        for i, field in enumerate(self.FIELDS):
+            value = getattr(self, field)
+            if value != getattr(other, field):
+                changes.append((i + 1, value))
+        return changes
+
+
+class Occupation(Record):
+    HEADERS = ["occupation code", "occupation", "occupation link", "description", "average salary", "future demand",
+               "job type",
+               "skill level", "industry", "skills", "number of vacancies",
+               "link to vacancies", "link to courses", "apprenticeships and traineeships",
+               "overview : interests", "overview : considerations", "overview : day-to-day"]
+    __slots__ = tuple(attribute_name(header) for header in HEADERS)
+
+
+class Vacancy(Record):
+    HEADERS = ["occupation", "occupation link", "date added", "time scrapped", "job title", "job link", "job code", "company", "salary",
+               "address", "lat", "long", "tenure", "overview", "closes", "description"]
+    __slots__ = tuple(attribute_name(header) for header in HEADERS)
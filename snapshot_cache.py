@@ -0,0 +1,61 @@
+# snapshot_cache.py
+import fcntl
+import json
+import os
+import tempfile
+import zlib
+
+
+class SnapshotCache:
+    def __init__(self, cache_dir=None):
+        # one private directory per user, the shared temp dir is writable by everyone on the host
+        self.cache_dir = cache_dir or os.environ.get("SHEETS_SNAPSHOT_DIR") or os.path.join(
+            tempfile.gettempdir(), f"yourcareer_snapshots_{os.getuid()}")
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        if os.stat(self.cache_dir).st_uid != os.getuid():
+            raise PermissionError(f"{self.cache_dir} belongs to another user")
+        os.chmod(self.cache_dir, 0o700)
+
+    def get(self, key, revision, fetch):
+        # the lock makes concurrent processes wait for one download instead of repeating it
+        path = os.path.join(self.cache_dir, f"{key}.json.z")
+        with open(path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                rows = self._load(path, revision)
+                if rows is None:
+                    rows = fetch()
+                    self._store(path, revision, rows)
+                return rows
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def invalidate(self, prefix):
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix) and name.endswith(".json.z"):
+                path = os.path.join(self.cache_dir, name)
+                # a download in progress for this key finishes writing before the file goes
+                with open(path + ".lock", "a") as lock:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    finally:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _load(path, revision):
+        try:
+            with open(path, "rb") as f:
+                stored_revision, rows = json.loads(zlib.decompress(f.read()))
+        except (FileNotFoundError, zlib.error, ValueError, TypeError):
+            return None
+        return rows if stored_revision == revision else None
+
+    @staticmethod
+    def _store(path, revision, rows):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(zlib.compress(json.dumps([revision, rows]).encode("utf-8")))
+        os.replace(tmp_path, path)
@@ -0,0 +1,92 @@
+# test_page_fetcher.py
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from page_fetcher import HttpFetcher, Page, PageFetcher
+
+PAGES = {
+    "/static": '<html><body><div class="card">Static card</div></body></html>',
+    # rendered client side, the card only exists after the script runs
+    "/dynamic": '<html><body><div id="root"></div><script src="app.js"></script></body></html>',
+}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    hits = []
+
+    def do_GET(self):
+        FixtureHandler.hits.append(self.path)
+        body = PAGES.get(self.path)
+        self.send_response(200 if body else 404)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.end_headers()
+        self.wfile.write((body or "not found").encode("utf-8"))
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.urls = []
+
+    def fetch(self, url, ready_selector=None):
+        self.urls.append(url)
+        return Page(url, 200, '<div class="card">Rendered card</div>', "browser")
+
+
+class PageFetcherTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FixtureHandler.hits.clear()
+
+    def auto_fetcher(self):
+        fetcher = PageFetcher(http=HttpFetcher(), mode="auto")
+        fetcher.browser = FakeBrowser()
+        return fetcher
+
+    def test_http_fetcher_reads_page(self):
+        page = HttpFetcher().fetch(self.base + "/static")
+        self.assertEqual(page.status, 200)
+        self.assertEqual(page.via, "http")
+        self.assertTrue(page.has(".card"))
+        self.assertEqual(page.select(".card")[0].text_content(), "Static card")
+
+    def test_http_fetcher_reports_status(self):
+        self.assertEqual(HttpFetcher().fetch(self.base + "/missing").status, 404)
+
+    def test_auto_keeps_complete_http_page(self):
+        fetcher = self.auto_fetcher()
+        page = fetcher.fetch(self.base + "/static", ".card")
+        self.assertEqual(page.via, "http")
+        self.assertEqual(fetcher.browser.urls, [])
+
+    def test_auto_falls_back_to_browser(self):
+        fetcher = self.auto_fetcher()
+        page = fetcher.fetch(self.base + "/dynamic", ".card")
+        self.assertEqual(page.via, "browser")
+        self.assertEqual(FixtureHandler.hits, ["/dynamic"])
+        # the host is remembered, the next page skips the wasted HTTP request
+        fetcher.fetch(self.base + "/dynamic", ".card")
+        self.assertEqual(FixtureHandler.hits, ["/dynamic"])
+        self.assertEqual(len(fetcher.browser.urls), 2)
+
+    def test_http_mode_never_uses_browser(self):
+        fetcher = PageFetcher(http=HttpFetcher(), mode="http")
+        page = fetcher.fetch(self.base + "/dynamic", ".card")
+        self.assertEqual((page.status, page.via), (0, "none"))
+
+
+if __name__ == "__main__":
+    unittest.main()
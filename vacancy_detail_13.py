@@ -1,19 +1,38 @@
 # vacancy_detail.py
 import json
+import os
 import re
 import time
 import gspread
 
 from selenium.common.exceptions import NoSuchElementException, TimeoutException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
+from browser_pool import BrowserPool
+from detail_specs import PARSE_MODE, VACANCY_DETAIL_SPEC, VACANCY_MAP_SPEC, extract_fields, parse_later, resolve
+from driver_manager import DriverManager
 from google_form_package import Sheet
+from keyed_upsert import CLOSED_PREFIX, STORAGE_MODE
+from output_sink import open_sink
+from page_cache import open_page_cache
+from page_fetcher import PageFetcher
+from page_readiness import polite_get, wait_until_ready
 from process_handler import ProcessHandler
+from records import Vacancy
 
-web_sheet = Sheet()
-driver = web_sheet.set_driver()
+# the spawned parse workers import this file as __mp_main__, only the run itself opens the sheet
+if __name__ == "__main__":
+    web_sheet = Sheet()
+    sink = open_sink(web_sheet)
+    # only used to revalidate cached detail pages over plain HTTP
+    fetcher = PageFetcher(cache=open_page_cache())
+# BROWSER_POOL_SIZE runs every row in the first detail process on a pool of browsers
+POOL_MODE = bool(os.environ.get("BROWSER_POOL_SIZE"))
+CACHE_SPEC = VACANCY_DETAIL_SPEC + VACANCY_MAP_SPEC
+DETAIL_COLUMNS = [Vacancy.column(field) for field in
+                  ["company", "salary", "address", "lat", "long", "tenure", "closes", "description"]]
+FAILED_VALUE = "Failed to load detail page"
+FAILED_DETAIL = ({field["name"]: FAILED_VALUE for field in VACANCY_DETAIL_SPEC}, FAILED_VALUE, FAILED_VALUE)
 
 def get_worksheet_with_retry(sheet_name, retries=3, delay=5):
     for attempt in range(retries):
@@ -29,278 +48,191 @@ def get_worksheet_with_retry(sheet_name, retries=3, delay=5):
                 raise
     raise Exception(f"Failed to get worksheet {sheet_name} after {retries} attempts.")
 
-def wait_for_page_load(wait_driver, timeout=15):
-    try:
-        WebDriverWait(wait_driver, timeout).until(
-            lambda d: d.execute_script("return document.readyState") == "complete"
-        )
-    except TimeoutException:
-        print("Page loading timeout.")
-    except Exception as e:
-        print(f"An error occurred while waiting for page load: {e}")
-        
-def extract(va_sheet):
-    retries = 3
-    delay = 5
-    for attempt in range(retries):
+def new_driver():
+    web_driver = web_sheet.set_driver()
+    web_driver.set_page_load_timeout(120)
+    return web_driver
+
+def extract():
+    # job links are streamed in row windows, the Vacancies table is never held in memory
+    for row_num, (link, company, closes) in sink.iter_rows("Vacancies", ["job link", "company", "closes"]):
+        if not link:
+            return
+        # upserted rows keep their details between runs, only new, changed and failed rows are scraped
+        filled = STORAGE_MODE == "upsert" and (
+            (company and company != FAILED_VALUE) or closes.startswith(CLOSED_PREFIX))
+        yield row_num - 2, {"link_row_num": row_num, "detail_url": link, "filled": filled}
+
+def scrape_detail(web_driver, url):
+    # load one detail page and return (fields, lat, long), None when it never loaded
+    # in upsert mode filled rows are skipped, a row that gets here is new or was cleared because its listing
+    # changed, and the cached fields of a changed listing are stale
+    cached = None if STORAGE_MODE == "upsert" else fetcher.cached_fields(url, "vacancy_detail", CACHE_SPEC)
+    if cached is not None:
+        print(f"unchanged since last run: {url}")
+        return cached, cached["lat"], cached["long"]
+    max_retries = 3
+    loaded = False
+    for attempt in range(1, max_retries + 1):
         try:
-            va_sheet_header = va_sheet.row_values(1)
+            print(f"loading page, attempt {attempt}: {url}")
+            polite_get(web_driver, url)
+            loaded = True
             break
-        except gspread.exceptions.APIError as e:
-            if "429" in str(e):
-                print(f"Read quota error when fetching header. Retrying in {delay} seconds... (Attempt {attempt+1}/{retries})")
-                time.sleep(delay)
-                delay *= 2
+        except TimeoutException:
+            print(f"Timeout occured in {attempt} attempt: {url}")
+            if attempt < max_retries:
+                time.sleep(5)
             else:
-                raise
-    else:
-        raise Exception("Failed to fetch worksheet header after multiple attempts.")
-
+                print("Exceed max retry, skiping page.")
+                loaded = False
+    if not loaded:
+        return None
     try:
-        link_idx = va_sheet_header.index("job link") + 1
-    except ValueError as e:
-        print("Could not detect requested row", e)
-        return []
+        wait_until_ready(web_driver, "vacancy_detail", elements=False)
+    except TimeoutException:
+        print(f"Detail page did not settle, reading what loaded: {url}")
+    print(f"current page: {url}")
 
-    for attempt in range(3):
+    if PARSE_MODE == "offline":
+        # the captured HTML is parsed on another core while this driver follows the map link
+        fields = parse_later(web_driver.page_source, VACANCY_DETAIL_SPEC, url)
+        map_link = extract_fields(web_driver, VACANCY_MAP_SPEC)["map_link"]
+    else:
+        # every field comes back from one in-page evaluation of the spec
+        fields = extract_fields(web_driver, VACANCY_DETAIL_SPEC + VACANCY_MAP_SPEC)
+        map_link = fields["map_link"]
+
+    va_lat = "No lat given"
+    va_long = "No long given"
+    map_failed = False
+    if map_link:
         try:
-            all_rows = va_sheet.get_all_values()[1:]
-            break
-        except gspread.exceptions.APIError as e:
-            if "429" in str(e):
-                print(f"Read quota error when fetching all values. Retrying in {delay} seconds... (Attempt {attempt+1}/{retries})")
-                time.sleep(delay)
-                delay *= 2
-            else:
-                raise
+            web_driver.get(map_link)
+            WebDriverWait(web_driver, 30).until(lambda d: "@" in d.current_url)
+            match = re.search(r"@(-?\d+\.\d+),(-?\d+\.\d+)", web_driver.current_url)
+            if match:
+                va_lat, va_long = match.groups()
+        except TimeoutException as e:
+            print("Map extraction error:", e)
+            map_failed = True
     else:
-        raise Exception("Failed to fetch all values after 3 attempts.")
-    link_list = []
-    for row_num, row in enumerate(all_rows, start=2):
-        link = row[link_idx - 1] if len(row) >= link_idx else ""
-        if not link:
-            break
-        link_list.append({"link_row_num": row_num, "detail_url": link})
-    return link_list
-
-def batch_update_multiple_rows(worksheet, updates_list, retries=3, delay=10):
-    sheet_id = getattr(worksheet, 'id', None) or worksheet._properties.get('sheetId')
-    requests = []
-    for row_num, updates in updates_list:
-        for col, value in updates:
-            requests.append({
-                "updateCells": {
-                    "range": {
-                        "sheetId": sheet_id,
-                        "startRowIndex": row_num - 1,
-                        "endRowIndex": row_num,
-                        "startColumnIndex": col - 1,
-                        "endColumnIndex": col
-                    },
-                    "rows": [{
-                        "values": [{
-                            "userEnteredValue": {"stringValue": str(value)}
-                        }]
-                    }],
-                    "fields": "userEnteredValue"
-                }
-            })
-    body = {"requests": requests}
-
-    for attempt in range(retries):
+        print("Map extraction error: no directions link")
+    if not map_failed:
+        fetcher.remember(url, "vacancy_detail", CACHE_SPEC, fields, lat=va_lat, long=va_long)
+    return fields, va_lat, va_long
+
+def write_details(pending_updates):
+    # runs on the sheet writer thread, offline parses are awaited here instead of in the scraping loop
+    updates = []
+    for row_num, (fields, va_lat, va_long) in pending_updates:
         try:
-            worksheet.spreadsheet.batch_update(body)
-            return
-        except gspread.exceptions.APIError as e:
-            error_message = str(e)
-            if "429" in error_message or "503" in error_message:
-                print(f"API Error ({error_message}). Retrying after {delay} seconds... (Attempt {attempt+1}/{retries})")
-                time.sleep(delay)
-                delay *= 2
-            else:
-                raise
-    print("Failed to update cells after several attempts.")
+            fields = resolve(fields)
+        except Exception as e:
+            # one bad page is written as failed, the rest of the batch still goes out
+            print(f"Failed to parse detail of row {row_num}: {e}")
+            fields = FAILED_DETAIL[0]
+        values = [fields["company"], fields["salary"], fields["address"], va_lat, va_long, fields["tenure"],
+                  fields["closes"], fields["description"]]
+        updates.append((row_num, list(zip(DETAIL_COLUMNS, values))))
+    sink.update_cells("Vacancies", updates)
 
 def main():
-    va_sheet = get_worksheet_with_retry("Vacancies")
     progress_sheet = get_worksheet_with_retry("Progress")
-    extracted_list = extract(va_sheet)
-    ph = ProcessHandler(progress_sheet, {"progress": "setting", "RowNum": 12}, "M4")
+    ph = ProcessHandler(progress_sheet, {"progress": "setting", "RowNum": 12}, "M4", shutdown_callback=web_sheet.flush)
     progress = ph.load_progress()
-    vac_sheet_header = va_sheet.row_values(1)
-    try:
-        col_company = vac_sheet_header.index("company") + 1
-        col_salary = vac_sheet_header.index("salary") + 1
-        col_address = vac_sheet_header.index("address") + 1
-        col_lat = vac_sheet_header.index("lat") + 1
-        col_long = vac_sheet_header.index("long") + 1
-        col_tenure = vac_sheet_header.index("tenure") + 1
-        col_closes = vac_sheet_header.index("closes") + 1
-        col_description = vac_sheet_header.index("description") + 1
-
-    except ValueError:
-        print("Column not in sheet")
+    if POOL_MODE:
+        if ph.init_value["RowNum"] != 0:
+            print("Pool mode runs every row from the first detail process, nothing to do here.")
+            return
+        main_pool(ph, progress)
         return
-    driver.set_page_load_timeout(120)
+    # Chrome is recycled every DRIVER_MAX_PAGES pages or DRIVER_MAX_RSS_MB, and restarted if it crashes
+    drivers = DriverManager(new_driver)
     pending_updates = []
     while not progress["progress"] == "finished":
         try:
             progress["progress"] = "processing"
-            while progress["RowNum"] < len(extracted_list):
-                row_and_index = extracted_list[progress["RowNum"]]
+            for list_index, row_and_index in extract():
+                # every process takes every 15th row starting from its own offset
+                if list_index != progress["RowNum"]:
+                    continue
+                if row_and_index["filled"]:
+                    progress["RowNum"] += 15
+                    continue
                 row_num = row_and_index["link_row_num"]
                 url = row_and_index["detail_url"]
                 if url == "No detail url given":
-                    company = "Failed to load detail page"
-                    salary = "Failed to load detail page"
-                    address = "Failed to load detail page"
-                    va_lat = "Failed to load detail page"
-                    va_long = "Failed to load detail page"
-                    tenure = "Failed to load detail page"
-                    closes = "Failed to load detail page"
-                    job_description = "Failed to load detail page"
+                    detail = FAILED_DETAIL
                     print(f"Failed to find detail of row {progress["RowNum"]}. Skipping...")
-                    progress["RowNum"] += 15
                 else:
-                    max_retries = 3
-                    loaded = False
-                    for attempt in range(1, max_retries + 1):
-                        try:
-                            print(f"loading page, attempt {attempt}: {url}")
-                            driver.get(url)
-                            loaded = True
-                            break
-                        except TimeoutException:
-                            print(f"Timeout occured in {attempt} attempt: {url}")
-                            if attempt < max_retries:
-                                time.sleep(5)
-                            else:
-                                print("Exceed max retry, skiping page.")
-                                loaded = False
-                    if not loaded:
-                        company = "Failed to load detail page"
-                        salary = "Failed to load detail page"
-                        address = "Failed to load detail page"
-                        va_lat = "Failed to load detail page"
-                        va_long = "Failed to load detail page"
-                        tenure = "Failed to load detail page"
-                        closes = "Failed to load detail page"
-                        job_description = "Failed to load detail page"
-                        progress["RowNum"] += 15
-                        continue
-                    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                    wait_for_page_load(driver)
-                    print(f"current page: {url}")
-
-                    try:
-                        company_element = driver.find_element(By.XPATH, "//p[b[contains(text(), 'Company:')]]")
-                        company_text = company_element.text
-                        company = company_text.replace("Company:", "").strip()
-                    except NoSuchElementException:
-                        try:
-                            company_elem = WebDriverWait(driver, 10).until(
-                                EC.visibility_of_element_located((By.XPATH, "//*[@id='find-a-job']//div[contains(@class, 'text-lg')]//p/a"))
-                            )
-                            company = company_elem.text.strip()
-                        except (NoSuchElementException, TimeoutException):
-                            company = "No company given"
-                    except Exception as e:
-                        print(f"An error occurred while finding company data: {e}")
-                        company = "No company given"
-
-                    try:
-                        address = driver.find_element(By.CSS_SELECTOR, "div[class='address-text']").text
-                    except NoSuchElementException:
-                        address = "No address given"
-
-                    try:
-                        salary = driver.find_element(
-                            By.CSS_SELECTOR,
-                            "ul.job-info-metadata > li:nth-child(2) > span:nth-of-type(2)"
-                        ).text
-                    except NoSuchElementException:
-                        salary = "No salary given"
-
-                    try:
-                        tenure = driver.find_element(
-                            By.CSS_SELECTOR,
-                            "ul.job-info-metadata > li:nth-child(3) > span:nth-of-type(2)"
-                        ).text
-                    except NoSuchElementException:
-                        tenure = "No tenure given"
-
-                    try:
-                        closes = driver.find_element(By.CSS_SELECTOR,
-                                                     "ul.job-info-metadata > li:nth-child(4) > span:nth-child(2)").text
-                    except NoSuchElementException:
-                        closes = "No close time given"
-
-                    try:
-                        all_cards = driver.find_elements(By.CSS_SELECTOR, "div.card-copy")
-                        description_card = None
-                        for card in all_cards:
-                            try:
-                                header = card.find_element(By.CSS_SELECTOR, "h2")
-                                if "Job description" in header.text:
-                                    description_card = card
-                                    break
-                            except Exception:
-                                continue
-                        if description_card:
-                            paragraphs = description_card.find_elements(By.TAG_NAME, "p")
-                            job_description = "\n".join([p.text for p in paragraphs])
-                        else:
-                            job_description = "No description given"
-
-                    except NoSuchElementException:
-                        job_description = "No description given"
-
-                    try:
-                        va_map = driver.find_element(By.CSS_SELECTOR, "a[class='custom mint-button secondary direction-btn']")
-                        link = va_map.get_attribute("href")
-                        driver.get(link)
-                        WebDriverWait(driver, 30).until(lambda d: "@" in d.current_url)
-                        map_url = driver.current_url
-                        pattern = r"@(-?\d+\.\d+),(-?\d+\.\d+)"
-                        match = re.search(pattern, map_url)
-                        if match:
-                            va_lat, va_long = match.groups()
-                        else:
-                            va_lat = "No lat given"
-                            va_long = "No long given"
-                    except (NoSuchElementException, TimeoutException) as e:
-                        print("Map extraction error:", e)
-                        va_lat = "No lat given"
-                        va_long = "No long given"
-
-                va_data = [
-                        (col_company, company),
-                        (col_salary, salary),
-                        (col_address, address),
-                        (col_lat, va_lat),
-                        (col_long, va_long),
-                        (col_tenure, tenure),
-                        (col_closes, closes),
-                        (col_description, job_description)
-                ]
-                pending_updates.append((row_num, va_data))
-                time.sleep(3)
+                    detail = drivers.run(scrape_detail, url)
                 progress["RowNum"] += 15
+                if detail is None:
+                    continue
+                pending_updates.append((row_num, detail))
                 if len(pending_updates) >= 20:
-                    batch_update_multiple_rows(va_sheet, pending_updates)
-                    progress_sheet.update(values=[[json.dumps({"progress": "processing", "RowNum": progress["RowNum"]})]], range_name="M4")
+                    web_sheet.submit(write_details, pending_updates)
+                    web_sheet.submit(progress_sheet.update, values=[[json.dumps(dict(progress, progress="processing"))]], range_name="M4")
                     pending_updates = []
 
             if pending_updates:
-                batch_update_multiple_rows(va_sheet, pending_updates)
+                web_sheet.submit(write_details, pending_updates)
                 pending_updates = []
-                
+            web_sheet.flush()
             progress["progress"] = "finished"
             ph.save_progress(progress)
         except NoSuchElementException as e:
             print(f"Error processing detail: {e}")
             continue
-    driver.quit()
+    drivers.quit()
+    print("Saved every data into the Google Sheet successfully.")
+
+def scrape_pooled(web_driver, row):
+    if row[1]["filled"]:
+        return None
+    url = row[1]["detail_url"]
+    if url == "No detail url given":
+        return FAILED_DETAIL
+    return scrape_detail(web_driver, url)
+
+def main_pool(ph, progress):
+    # one process, BROWSER_POOL_SIZE browsers, every row from the saved position onwards
+    # pool rows advance one at a time, shard rows by 15 from an offset, so each mode keeps its own position
+    pool_progress = progress.setdefault("Pool", {"progress": "setting", "RowNum": 0})
+    if pool_progress["progress"] == "finished":
+        print("Pool mode already finished.")
+        return
+    pool = BrowserPool(new_driver)
+    rows = (row for row in extract() if row[0] >= pool_progress["RowNum"])
+    done = set()
+    pending_updates = []
+    pool_progress["progress"] = "processing"
+    try:
+        for (list_index, row_and_index), detail, error in pool.imap_unordered(scrape_pooled, rows):
+            if error:
+                # written as failed like a page that never loads, never skipped without a trace
+                print(f"Error processing detail of row {row_and_index['link_row_num']}: {error}")
+                detail = FAILED_DETAIL
+            if detail is not None:
+                pending_updates.append((row_and_index["link_row_num"], detail))
+            # results arrive out of order, progress only moves past rows that are all done
+            done.add(list_index)
+            while pool_progress["RowNum"] in done:
+                done.remove(pool_progress["RowNum"])
+                pool_progress["RowNum"] += 1
+            if len(pending_updates) >= 20:
+                web_sheet.submit(write_details, pending_updates)
+                web_sheet.submit(ph.save_progress, dict(progress, Pool=dict(pool_progress)))
+                pending_updates = []
+    finally:
+        # rows already scraped are kept, a pool that stopped early leaves the run unfinished
+        if pending_updates:
+            web_sheet.submit(write_details, pending_updates)
+        web_sheet.submit(ph.save_progress, dict(progress, Pool=dict(pool_progress)))
+        web_sheet.flush()
+    pool_progress["progress"] = "finished"
+    ph.save_progress(progress)
     print("Saved every data into the Google Sheet successfully.")
 
 if __name__ == "__main__":
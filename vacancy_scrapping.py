@@ -0,0 +1,396 @@
+# vacancy_scrapping.py
+import datetime
+import os
+import queue
+import re
+import sys
+import threading
+from urllib.parse import parse_qsl, urljoin  # join url
+
+from selenium.common.exceptions import TimeoutException
+
+from driver_manager import DriverManager
+from google_form_package import Sheet
+from keyed_upsert import CLOSED_PREFIX, STORAGE_MODE, KeyedUpsert
+from listing_cards import MISSING, VACANCY_CARD_FIELDS, extract_listing
+from output_sink import open_sink
+from page_leases import PageLeases
+from page_readiness import polite_get, wait_until_ready
+from pagination_planner import plan_pages
+from partition_planner import CRAWL_JOB_AGES, CRAWL_STATES, plan_partitions, vacancy_search_url, with_query
+from process_handler import ProcessHandler
+from records import Vacancy
+from write_spool import WriteSpool
+
+web_sheet = Sheet()
+sink = open_sink(web_sheet)
+# python vacancy_scrapping.py [workers], every worker drives its own Chrome
+LISTING_WORKERS = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.environ.get("LISTING_WORKERS", 5))
+BASE_URL = "https://www.workforceaustralia.gov.au"
+# the page-leased crawl covers the first state and jobAge window, partitions cover all of them
+SEARCH_URL = vacancy_search_url(CRAWL_STATES[0], CRAWL_JOB_AGES[0])
+# every state x jobAge window is a partition, one worker crawls a partition from first to last page
+CRAWL_PARTITIONS = os.environ.get("CRAWL_PARTITIONS", "0") == "1"
+# full: clear both sheets and scrape the whole window; incremental: keep them, append only unseen job codes
+CRAWL_MODE = os.environ.get("CRAWL_MODE", "full")
+# the search's newest-first ordering, an incremental crawl stops at the first page of known jobs
+NEWEST_FIRST = os.environ.get("NEWEST_FIRST_QUERY", "sort=DateAdded")
+JOB_CODE_INDEX = Vacancy.column("job code") - 1
+DATE_ADDED_INDEX = Vacancy.column("date added") - 1
+# jobAge=3 only lists recent postings, older ones drop out of the search without closing
+LISTING_WINDOW_DAYS = int(os.environ.get("LISTING_WINDOW_DAYS", 3))
+# seen_jobs is shared by the crawler threads
+seen_lock = threading.Lock()
+# None until the first two pages of a listing are checked, False for good once any page or page boundary is
+# out of date order; pages holds the (newest, oldest) date of every checked page by (listing, page)
+date_order = {"newest_first": None, "pages": {}}
+
+def set_vacancy_sheet():
+    # set for vacancy sheet
+    sink.reset("Vacancies", Vacancy.HEADERS)
+
+def set_vacancy_data_sheet():
+    # set for VacancyData sheet
+    sink.reset("VacancyData", ["job code"])
+
+
+def load_to_seen_data():
+    seen_jobs = load_seen_jobs_data()
+    try:
+        job_codes = sink.read_columns("Vacancies", ["job code"])[0]
+    except ValueError as e:
+        print("Could not detect requested row", e)
+        return
+
+    new_job_codes = []
+    for vac_code in job_codes:
+        if vac_code and vac_code.lower() not in seen_jobs:
+            new_job_codes.append([vac_code])
+            seen_jobs.add(vac_code.lower())
+
+    if new_job_codes:
+        sink.append_rows("VacancyData", new_job_codes)
+
+def save_seen_jobs_data(seen_jobs, new_codes):
+    # VacancyData is the persistent index in incremental mode, only this run's codes are added to it
+    with seen_lock:
+        codes = list(new_codes) if CRAWL_MODE == "incremental" else list(seen_jobs)
+    rows = [[job_code] for job_code in codes]
+    sink.append_rows("VacancyData", rows)
+
+def load_seen_jobs_data():
+    seen_jobs = set()
+    for row in sink.get_all_values("VacancyData")[1:]:
+        if row and len(row) >= 1:
+            seen_jobs.add(row[0].strip().lower())
+    return seen_jobs
+
+def card_to_row(card):
+    # find job title
+    if card["job_href"] is MISSING:
+        job_title = "No job title given"
+        job_link = "No job link given"
+        job_code = "No job code given"
+    else:
+        job_title = card["job_title"]
+        job_link = urljoin(BASE_URL, card["job_href"])
+        job_code = card["job_href"].split('/')[-1]
+
+    if card["preheading"] is MISSING:
+        date_added = "No date added given"
+    else:
+        match = re.search(r'\d+', card["preheading"])
+        if match:
+            date_added_dif = int(match.group())
+        else:
+            date_added_dif = 1
+        today = datetime.date.today()
+        date_added = (today - datetime.timedelta(days=date_added_dif)).strftime("%B %d, %Y")
+
+    time_scrapped = datetime.datetime.now().strftime("%B %d, %Y %I:%M %p")
+
+    overview = card["overview"] if card["overview"] is not MISSING else "No overview given"
+
+    vacancy = Vacancy(date_added=str(date_added),
+                      time_scrapped=str(time_scrapped),
+                      job_title=job_title,
+                      job_link=job_link,
+                      job_code=job_code,
+                      overview=overview)
+    return vacancy.to_row()
+
+def crawl_params():
+    # query params every listing url carries besides its filters, the partition probes use them too
+    return dict(parse_qsl(NEWEST_FIRST)) if CRAWL_MODE == "incremental" else {}
+
+def search_url(page, base=SEARCH_URL):
+    return with_query(base, dict(crawl_params(), pageNumber=page))
+
+def scrape_page(web_driver, va_url, plan=False):
+    polite_get(web_driver, va_url)
+    print(f"current page: {va_url}")
+    wait_until_ready(web_driver, "vacancy_listing", elements=False)
+    vacancies, has_next = extract_listing(web_driver, "vacancy_listing", VACANCY_CARD_FIELDS)
+    # until the listing is planned, every page read tries to plan it from the result count
+    pages = plan_pages(web_driver, "vacancy_listing", len(vacancies), has_next) if plan else None
+    return [card_to_row(card) for card in vacancies], has_next, pages
+
+def crawl(leases, spool, seen_jobs, new_codes, upsert, progress):
+    # claims pages until the listing is done, a slow or failed page goes back to the other workers
+    drivers = DriverManager(web_sheet.set_driver)
+    try:
+        while True:
+            page = leases.claim()
+            if page is None:
+                break
+            try:
+                rows, has_next, pages = drivers.run(scrape_page, search_url(page), not leases.planned)
+            except TimeoutException:
+                print(f"Vacancy elements for page {page} did not load in time.")
+                leases.fail(page)
+                continue
+            except Exception as e:
+                print(f"An error occurred on page {page}: {e}")
+                leases.fail(page)
+                continue
+            if pages:
+                leases.plan(pages[-1])
+            check_date_order(rows, "listing", page, leases.first_page)
+            known_page = is_known_page(rows, seen_jobs, page)
+            if not leases.complete(page, has_next and not known_page):
+                continue
+            store_rows(rows, spool, seen_jobs, new_codes, upsert)
+            progress["UrlNum"] = leases.watermark
+    finally:
+        drivers.quit()
+
+def dates_added(rows):
+    dates = []
+    for row in rows:
+        try:
+            dates.append(datetime.datetime.strptime(row[DATE_ADDED_INDEX], "%B %d, %Y").date())
+        except ValueError:
+            continue
+    return dates
+
+def check_date_order(rows, listing, page, first_page):
+    # the known-page stop relies on NEWEST_FIRST, which the site may ignore and keep relevance order;
+    # without the sort in the query the order is never trusted
+    if CRAWL_MODE != "incremental" or not NEWEST_FIRST:
+        return
+    dates = dates_added(rows)
+    ordered = all(earlier >= later for earlier, later in zip(dates, dates[1:]))
+    with seen_lock:
+        pages = date_order["pages"]
+        if dates:
+            pages[(listing, page)] = (dates[0], dates[-1])
+            # pages finish out of order, each one is checked against whichever neighbour is already in
+            previous = pages.get((listing, page - 1))
+            following = pages.get((listing, page + 1))
+            ordered = (ordered and (not previous or previous[1] >= dates[0])
+                       and (not following or dates[-1] >= following[0]))
+        if not ordered and date_order["newest_first"] is not False:
+            print("The listing is not sorted newest first, crawling every page instead")
+            date_order["newest_first"] = False
+        elif (date_order["newest_first"] is None and (listing, first_page) in pages
+              and (listing, first_page + 1) in pages):
+            # the boundary between the two was checked when the later of them came in
+            date_order["newest_first"] = True
+
+def is_known_page(rows, seen_jobs, label):
+    if CRAWL_MODE != "incremental" or not date_order["newest_first"]:
+        return False
+    with seen_lock:
+        known_page = bool(rows) and all(row[JOB_CODE_INDEX].lower() in seen_jobs for row in rows)
+    if known_page:
+        print(f"Every job on page {label} is already known, stopping here")
+    return known_page
+
+def store_rows(rows, spool, seen_jobs, new_codes, upsert, crawled=None):
+    with seen_lock:
+        if crawled is not None:
+            # partitions can overlap, a job already crawled in this run is kept once
+            rows = [row for row in rows if row[JOB_CODE_INDEX] == "No job code given"
+                    or row[JOB_CODE_INDEX].lower() not in crawled]
+            crawled.update(row[JOB_CODE_INDEX].lower() for row in rows)
+        if CRAWL_MODE == "incremental":
+            rows = [row for row in rows if row[JOB_CODE_INDEX].lower() not in seen_jobs]
+            new_codes.extend(row[JOB_CODE_INDEX] for row in rows)
+        seen_jobs.update(row[JOB_CODE_INDEX].lower() for row in rows)
+    updates = []
+    if upsert:
+        rows, updates = upsert.split([Vacancy.from_row(row) for row in rows])
+    if rows:
+        spool.append(rows)
+    if updates:
+        # a changed listing also clears company, so the detail stage scrapes that posting again
+        web_sheet.submit(sink.update_cells, "Vacancies",
+                         [(row_num, changes + [(Vacancy.column("company"), "")]) for row_num, changes in updates])
+
+def crawl_partition(drivers, partition, spool, seen_jobs, new_codes, upsert, crawled, max_attempts=3):
+    page = partition.first_page
+    attempts = 0
+    while True:
+        try:
+            rows, has_next, _ = drivers.run(scrape_page, partition.page_url(page))
+        except TimeoutException:
+            print(f"Vacancy elements for {partition.name} page {page} did not load in time.")
+            rows = None
+        except Exception as e:
+            print(f"An error occurred on {partition.name} page {page}: {e}")
+            rows = None
+        if rows is None:
+            attempts += 1
+            if attempts < max_attempts:
+                continue
+            # a page that never loads ends the partition, as it ends the page-leased listing
+            print(f"Giving up on {partition.name} at page {page}")
+            return False
+        attempts = 0
+        check_date_order(rows, partition.name, page, partition.first_page)
+        known_page = is_known_page(rows, seen_jobs, f"{page} of {partition.name}")
+        store_rows(rows, spool, seen_jobs, new_codes, upsert, crawled)
+        # a page range stops at its planned last page, the next range carries on from there
+        if not has_next or known_page or page == partition.last_page:
+            return True
+        page += 1
+
+def crawl_partitions(partitions, spool, seen_jobs, new_codes, upsert, crawled, progress, complete):
+    # the partitions are the unit of work, idle workers take the next one from the shared queue
+    drivers = DriverManager(web_sheet.set_driver)
+    try:
+        while True:
+            try:
+                partition = partitions.get_nowait()
+            except queue.Empty:
+                break
+            print(f"Crawling {partition.name} ({partition.pages} pages planned)")
+            if not crawl_partition(drivers, partition, spool, seen_jobs, new_codes, upsert, crawled):
+                complete.append(False)
+                continue
+            with seen_lock:
+                progress["Partitions"].append(partition.name)
+    finally:
+        drivers.quit()
+
+def crawl_pages(progress, spool, seen_jobs, new_codes, upsert):
+    # True when this run read every page of the listing, from the first to the last
+    leases = PageLeases(first_page=progress.get("UrlNum", 1))
+    workers = [threading.Thread(target=crawl, args=(leases, spool, seen_jobs, new_codes, upsert, progress),
+                                name=f"crawler-{i}")
+               for i in range(LISTING_WORKERS)]
+    print(f"Crawling vacancy pages from {leases.next_page} with {len(workers)} workers ({CRAWL_MODE})")
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    progress["UrlNum"] = leases.watermark
+    return leases.first_page == 1 and leases.finished and not leases.failed
+
+def run_partitions(progress, spool, seen_jobs, new_codes, upsert):
+    # True when every partition was crawled in full by this run, the only case that can close missing postings
+    progress.setdefault("Partitions", [])
+    resumed = bool(progress["Partitions"])
+    planner = DriverManager(web_sheet.set_driver)
+    try:
+        planned = planner.run(lambda driver: plan_partitions(driver, sink, params=crawl_params()))
+    finally:
+        planner.quit()
+    partitions = queue.Queue()
+    for partition in planned:
+        if partition.name not in progress["Partitions"]:
+            partitions.put(partition)
+    print(f"{len(planned)} partitions planned, {partitions.qsize()} left to crawl")
+    crawled = set()
+    if STORAGE_MODE == "rewrite":
+        # a partition cut short by a restart is crawled again from its first page, the rows it already
+        # wrote or spooled are in the sheet, so they are not appended twice
+        try:
+            crawled.update(code.lower() for code in sink.read_columns("Vacancies", ["job code"])[0] if code)
+        except ValueError as e:
+            print("Could not read crawled job codes", e)
+        crawled.update(row[JOB_CODE_INDEX].lower() for row, _ in spool.pending())
+        crawled.discard("no job code given")
+    complete = []
+    workers = [threading.Thread(target=crawl_partitions,
+                                args=(partitions, spool, seen_jobs, new_codes, upsert, crawled, progress, complete),
+                                name=f"crawler-{i}")
+               for i in range(min(LISTING_WORKERS, partitions.qsize()))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    # occupation partitions skip postings without an occupation, so they cannot tell which ones closed
+    return bool(planned) and not resumed and not complete and not any(partition.split for partition in planned)
+
+def close_missing(upsert):
+    # postings that left the listing stay in the sheet, marked closed instead of deleted
+    today = datetime.date.today()
+    updates = []
+    for row_num, vacancy in upsert.missing():
+        if vacancy.closes.startswith(CLOSED_PREFIX):
+            continue
+        try:
+            age = (today - datetime.datetime.strptime(vacancy.date_added, "%B %d, %Y").date()).days
+        except ValueError:
+            continue
+        if age <= LISTING_WINDOW_DAYS:
+            updates.append((row_num, [(Vacancy.column("closes"), f"{CLOSED_PREFIX} {today.strftime('%B %d, %Y')}")]))
+    print(f"{len(updates)} vacancies left the listing since the last run")
+    if updates:
+        sink.update_cells("Vacancies", updates)
+
+def main():
+    vac_sheet = web_sheet.get_worksheet("Vacancies")
+    progress_sheet = web_sheet.get_worksheet("Progress")
+    load_to_seen_data()
+    seen_jobs = load_seen_jobs_data()
+    new_codes = []
+    ph = ProcessHandler(progress_sheet, {"progress": "setting", "UrlNum": 1}, "A3",
+                        shutdown_callback=lambda: save_seen_jobs_data(seen_jobs, new_codes))
+    progress = ph.load_progress()
+    # a signal saves the live progress, UrlNum is the first page not yet done
+    ph.progress = progress
+    # scraped rows are spooled to disk and appended by a writer thread
+    spool = WriteSpool(sink, "Vacancies", "vacancy_scrapping")
+    if progress["progress"] == "setting":
+        spool.discard()
+        if CRAWL_MODE == "full" and STORAGE_MODE == "rewrite":
+            set_vacancy_sheet()
+            set_vacancy_data_sheet()
+    spool.start()
+    vac_sheet.update([["Running Scrapping"]], "Q1")
+
+    if not progress["progress"] == "finished":
+        progress["progress"] = "processing"
+        upsert = None
+        if STORAGE_MODE == "upsert":
+            upsert = KeyedUpsert(sink, "Vacancies", Vacancy, "job_code", volatile=["time_scrapped"],
+                                 placeholder="No job code given")
+        if CRAWL_PARTITIONS:
+            whole_listing = run_partitions(progress, spool, seen_jobs, new_codes, upsert)
+        else:
+            whole_listing = crawl_pages(progress, spool, seen_jobs, new_codes, upsert)
+        if upsert and CRAWL_MODE == "full" and whole_listing:
+            # only a crawl of the whole listing can tell which postings are gone
+            close_missing(upsert)
+        # a failed queued write raises here, before progress is saved as finished
+        web_sheet.flush()
+        progress["progress"] = "finished"
+        ph.save_progress(progress)
+        print("Finished scrapping")
+        if CRAWL_MODE == "incremental":
+            # the job code index persists between runs, only this run's new codes are added
+            print(f"{len(new_codes)} new vacancies")
+            if new_codes:
+                sink.append_rows("VacancyData", [[code] for code in new_codes])
+
+    spool.close()
+    web_sheet.flush()
+    if CRAWL_MODE == "full" and STORAGE_MODE == "rewrite":
+        set_vacancy_data_sheet()
+    print("Saved every data into the Google Sheet successfully.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# write_planner.py
+import json
+
+# Sheets API rejects batchUpdate bodies above 10MB; keep each body well under that
+MAX_PAYLOAD_BYTES = 2 * 1024 * 1024
+
+
+def merge_row_updates(updates_list):
+    # collapse repeated rows, later values win
+    rows = {}
+    for row_num, updates in updates_list:
+        row = rows.setdefault(row_num, {})
+        for col, value in updates:
+            row[col] = value
+
+    # split every row into runs of adjacent columns
+    segments = []
+    for row_num in sorted(rows):
+        run_start = None
+        run_values = []
+        for col in sorted(rows[row_num]):
+            if run_start is not None and col == run_start + len(run_values):
+                run_values.append(rows[row_num][col])
+            else:
+                if run_start is not None:
+                    segments.append((row_num, run_start, run_values))
+                run_start = col
+                run_values = [rows[row_num][col]]
+        if run_start is not None:
+            segments.append((row_num, run_start, run_values))
+    return segments
+
+
+def plan_rectangles(updates_list):
+    # stack runs that share a column span on consecutive rows into one rectangle
+    open_rects = {}
+    rectangles = []
+    for row_num, start_col, values in merge_row_updates(updates_list):
+        span = (start_col, len(values))
+        rect = open_rects.get(span)
+        if rect and rect["start_row"] + len(rect["rows"]) == row_num:
+            rect["rows"].append(values)
+            continue
+        rect = {"start_row": row_num, "start_col": start_col, "rows": [values]}
+        open_rects[span] = rect
+        rectangles.append(rect)
+    return rectangles
+
+
+def build_update_request(sheet_id, rect):
+    return {
+        "updateCells": {
+            "range": {
+                "sheetId": sheet_id,
+                "startRowIndex": rect["start_row"] - 1,
+                "endRowIndex": rect["start_row"] - 1 + len(rect["rows"]),
+                "startColumnIndex": rect["start_col"] - 1,
+                "endColumnIndex": rect["start_col"] - 1 + len(rect["rows"][0])
+            },
+            "rows": [{
+                "values": [{"userEnteredValue": {"stringValue": str(value)}} for value in row]
+            } for row in rect["rows"]],
+            "fields": "userEnteredValue"
+        }
+    }
+
+
+def sized_requests(sheet_id, rect, max_bytes):
+    # halve oversized rectangles by rows until each request fits
+    request = build_update_request(sheet_id, rect)
+    size = len(json.dumps(request))
+    if size <= max_bytes or len(rect["rows"]) == 1:
+        return [(request, size)]
+    half = len(rect["rows"]) // 2
+    top = {"start_row": rect["start_row"], "start_col": rect["start_col"], "rows": rect["rows"][:half]}
+    bottom = {"start_row": rect["start_row"] + half, "start_col": rect["start_col"], "rows": rect["rows"][half:]}
+    return sized_requests(sheet_id, top, max_bytes) + sized_requests(sheet_id, bottom, max_bytes)
+
+
+def plan_update_requests(sheet_id, updates_list, max_bytes=MAX_PAYLOAD_BYTES):
+    # updates_list: [(row_num, [(col, value), ...]), ...] with 1-based rows and columns
+    bodies = []
+    requests = []
+    body_size = 0
+    for rect in plan_rectangles(updates_list):
+        for request, size in sized_requests(sheet_id, rect, max_bytes):
+            if requests and body_size + size > max_bytes:
+                bodies.append({"requests": requests})
+                requests = []
+                body_size = 0
+            requests.append(request)
+            body_size += size
+    if requests:
+        bodies.append({"requests": requests})
+    return bodies
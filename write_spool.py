@@ -0,0 +1,136 @@
+# write_spool.py
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import gspread
+from requests import ConnectionError as RequestsConnectionError, ReadTimeout
+
+SPOOL_DIR = os.environ.get("SPOOL_DIR", "spool")
+# quota and server errors clear up on their own, anything else the API rejects will be rejected again
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def retryable(error):
+    if isinstance(error, gspread.exceptions.APIError):
+        return error.code in RETRY_STATUS
+    return True
+
+
+class WriteSpool:
+    def __init__(self, sink, table, name, batch_size=200, flush_interval=2, max_delay=60):
+        # rows go to an append-only file first, a writer thread drains it into the sink
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        self.sink = sink
+        self.table = table
+        self.path = os.path.join(SPOOL_DIR, f"{name}.jsonl")
+        self.offset_path = self.path + ".offset"
+        self.rejected_path = self.path + ".rejected"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_delay = max_delay
+        self.file_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name=f"spool-{name}", daemon=True)
+
+    def start(self):
+        leftover = len(self.pending())
+        if leftover:
+            print(f"Replaying {leftover} spooled rows from the previous run.")
+        self.thread.start()
+
+    def append(self, rows):
+        with self.file_lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self.wakeup.set()
+
+    def discard(self):
+        # a fresh run rebuilds the sheet, so rows spooled for the old one are dropped
+        with self.send_lock, self.file_lock:
+            for path in (self.path, self.offset_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def pending(self):
+        # returns [(row, offset after the row)] for every row not yet sent
+        offset = self.read_offset()
+        with self.file_lock:
+            if not os.path.exists(self.path):
+                return []
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        entries = []
+        # a row cut short by a crash has no newline yet and is left for the next read
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            entries.append((json.loads(line), offset))
+        return entries
+
+    def read_offset(self):
+        try:
+            with open(self.offset_path) as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def write_offset(self, offset):
+        tmp_path = self.offset_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp_path, self.offset_path)
+
+    def drain(self):
+        with self.send_lock:
+            entries = self.pending()
+            delay = 5
+            for start in range(0, len(entries), self.batch_size):
+                batch = entries[start:start + self.batch_size]
+                while True:
+                    try:
+                        self.sink.append_rows(self.table, [row for row, _ in batch])
+                        break
+                    except (gspread.exceptions.APIError, ReadTimeout, RequestsConnectionError, sqlite3.OperationalError) as e:
+                        if not retryable(e):
+                            self.quarantine(batch, e)
+                            break
+                        if self.stopped and delay > self.max_delay:
+                            return False
+                        print(f"Spool append failed ({e}). Retry after {delay} seconds")
+                        time.sleep(delay)
+                        delay = min(delay * 2, self.max_delay * 2)
+                self.write_offset(batch[-1][1])
+            return True
+
+    def quarantine(self, batch, error):
+        # a batch the sink refuses is set aside, so the rows behind it are still written
+        print(f"Spool append rejected ({error}), {len(batch)} rows moved to {self.rejected_path}")
+        with open(self.rejected_path, "a", encoding="utf-8") as f:
+            for row, _ in batch:
+                f.write(json.dumps(row) + "\n")
+
+    def run(self):
+        while not self.stopped:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.drain()
+
+    def close(self):
+        self.stopped = True
+        self.wakeup.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        if self.drain():
+            self.discard()
+        else:
+            print(f"{len(self.pending())} rows left in {self.path}, they will be replayed on the next start.")